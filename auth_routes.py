@@ -1,13 +1,19 @@
 from fastapi import Depends, APIRouter, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from .models import Users
-from .database import SessionLocal, get_db
-from typing import List
+from .database import get_db, get_async_db
+from typing import List, Literal
 from .schemas import UserResponse
-from .utils.password_hash import verify_password
+from .utils.password_hash import password_hasher
 from .utils.jwt_generation import create_access_token, decode_access_token
-from datetime import timedelta
+from .utils.ttl_cache import TTLCache
+from .user_export import export_users, EXPORT_MEDIA_TYPES, USER_EXPORT_COLUMNS
+from .utils.fast_json import list_response
+import os
 
 auth_router = APIRouter(
     prefix = '/auth',
@@ -17,10 +23,18 @@ auth_router = APIRouter(
 # Definition of the OAuth2 password authenticatio scheme, where /auth/login is the endpoint where users will request an access token
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
-def get_user_by_email(db: Session, email: str):
-    return db.query(Users).filter(Users.email == email).first()
+# Resolved users keyed by the token subject, so authenticated requests skip the Users lookup.
+# Entries are detached from their session and must be treated as read-only
+principal_cache = TTLCache(
+    maxsize=int(os.getenv("PRINCIPAL_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+)
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    result = await db.execute(select(Users).filter(Users.email == email))
+    return result.scalars().first()
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     # JWT token extracted from the request using Depends(oauth2_scheme)
     # Decoding of the token 
     payload = decode_access_token(token)
@@ -28,12 +42,19 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     if not payload:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
     
+    user = principal_cache.get(payload["sub"])
+    if user is not None:
+        return user
+
     # Fetch the user using the email stored in the JWT token
-    user = get_user_by_email(db, payload["sub"])
+    user = await get_user_by_email(db, payload["sub"])
 
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
     
+    db.expunge(user)
+    principal_cache.set(payload["sub"], user)
+
     return user
 
 @auth_router.get("/users", response_model=List[UserResponse])
@@ -44,16 +65,42 @@ def get_users(
     if not current_user.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access not allowed")
     
-    return db.query(Users).all()
+    # Plain columns serialized straight to JSON, no ORM objects or per-row validation
+    return list_response(db.execute(select(*USER_EXPORT_COLUMNS, Users.remember_token)).all(), UserResponse)
+
+# Whole users table for admin tooling, written out progressively instead of built in memory
+@auth_router.get("/users/export")
+def export_users_table(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    current_user: Users = Depends(get_current_user)
+):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access not allowed")
+
+    return StreamingResponse(
+        export_users(format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="users.{format}"'}
+    )
 
 @auth_router.post("/login")
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
     
     # Fetch the user
-    user = get_user_by_email(db, form_data.username)
+    user = await get_user_by_email(db, form_data.username)
 
-    if not user or not verify_password(form_data.password, user.password_hash):
+    if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+
+    valid, new_hash = await password_hasher.verify_and_update(form_data.password, user.password_hash)
+
+    if not valid:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+
+    # Upgrade hashes made with an outdated cost while we have the plain password
+    if new_hash:
+        user.password_hash = new_hash
+        await db.commit()
     
     access_token = create_access_token({"sub": user.email})
     
@@ -0,0 +1,104 @@
+# Catalog import throughput.
+#
+# Builds a scratch schema with the catalog tables and a few colors, sizes and categories,
+# writes a synthetic import file of --variants rows (products x colors x sizes) and imports
+# it three times: a first load into empty tables, an identical reload (which must write
+# nothing) and a reload with every price changed. Reports rows per second for each pass.
+# The scratch schema is dropped at the end unless --keep is given.
+#
+#   python -m package.benchmarks.catalog_import --database-url postgresql://... --variants 100000
+import argparse
+import csv
+import json
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import sessionmaker
+
+from ..catalog_import import import_catalog, IMPORT_BATCH_SIZE
+from ..models import Base, Categories, Colors, Sizes
+
+COLORS = [("NAV", "Navy"), ("WHT", "White"), ("BLK", "Black"), ("RED", "Red"), ("GRN", "Green"), ("BLU", "Blue")]
+SIZES = ["XS", "S", "M", "L", "XL", "XXL"]
+CATEGORIES = 20
+
+
+def write_file(path, variants, format, price_shift, seed):
+    rng = random.Random(seed)
+    per_product = 3 * len(SIZES)
+    fields = ["reference1", "product_name", "description_details", "category_ids", "color_code", "reference2", "size", "price", "stock", "image_urls"]
+    with open(path, "w", newline="", encoding="utf-8") as stream:
+        writer = csv.DictWriter(stream, fieldnames=fields) if format == "csv" else None
+        if writer:
+            writer.writeheader()
+        for i in range(variants):
+            product, rest = divmod(i, per_product)
+            color, size = divmod(rest, len(SIZES))
+            code = COLORS[(product + color) % len(COLORS)][0]
+            row = {
+                "reference1": f"HK{product:08d}",
+                "product_name": f"Product {product}",
+                "description_details": f"Synthetic product {product} for the import benchmark.",
+                "category_ids": f"{1 + product % CATEGORIES};{1 + (product * 7) % CATEGORIES}",
+                "color_code": code,
+                "reference2": f"V{i:09d}",
+                "size": SIZES[size],
+                "price": f"{20 + (product % 200) + price_shift:.2f}",
+                "stock": rng.randint(0, 50),
+                "image_urls": ";".join(f"https://img.example.com/{product}/{code}/{n}.jpg" for n in range(1, 4)),
+            }
+            if writer:
+                writer.writerow(row)
+            else:
+                stream.write(json.dumps(row) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bulk catalog import")
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--schema", default="bench_catalog_import")
+    parser.add_argument("--variants", type=int, default=100_000)
+    parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument("--keep", action="store_true", help="leave the scratch schema in place")
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url, connect_args={"options": f"-csearch_path={args.schema}"})
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {args.schema}"))
+        Base.metadata.create_all(conn)
+        conn.execute(insert(Colors.__table__).values([
+            {"name": name, "code": code, "image_url": f"{code}.jpg"} for code, name in COLORS
+        ]))
+        conn.execute(insert(Sizes.__table__).values([{"name": name} for name in SIZES]))
+        conn.execute(insert(Categories.__table__).values([
+            {"id": i, "name": f"Category {i}", "parent_id": 0} for i in range(1, CATEGORIES + 1)
+        ]))
+
+    Session = sessionmaker(bind=engine, autoflush=False)
+    with tempfile.TemporaryDirectory() as directory:
+        passes = [("first load", 0), ("identical reload", 0), ("price change", 5)]
+        print(f"{'pass':<18} {'rows':>8} {'failed':>7} {'products':>9} {'variants':>9} {'seconds':>8} {'rows/s':>8}")
+        for label, price_shift in passes:
+            path = os.path.join(directory, f"catalog.{args.format}")
+            write_file(path, args.variants, args.format, price_shift, seed=42)
+            with open(path, newline="", encoding="utf-8") as stream, Session() as db:
+                started = time.perf_counter()
+                report = import_catalog(db, stream, args.format, args.batch_size)
+                elapsed = time.perf_counter() - started
+            print(f"{label:<18} {report.rows:>8} {report.error_count:>7} {report.products_written:>9} "
+                  f"{report.variants_written:>9} {elapsed:>8.1f} {report.rows / elapsed:>8.0f}")
+            for error in report.errors[:5]:
+                print(f"  line {error['line']}: {error['error']}")
+
+    if not args.keep:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA {args.schema} CASCADE"))
+
+
+if __name__ == "__main__":
+    main()
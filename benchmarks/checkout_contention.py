@@ -0,0 +1,148 @@
+# Checkout under flash-sale contention.
+#
+# Builds a scratch schema, gives --users users an active cart holding --lines-per-cart of
+# the same --variants hot variants, and runs every checkout at once through place_order,
+# --concurrency at a time. Stock is deliberately short of demand so part of the checkouts
+# must fail. Reports throughput, latency percentiles and outcomes, then checks that no
+# variant was oversold and that stock taken equals the quantities ordered. The scratch
+# schema is dropped at the end unless --keep is given.
+#
+#   python -m package.benchmarks.checkout_contention --database-url postgresql://... \
+#       --users 2000 --variants 5 --stock 500 --concurrency 50
+import argparse
+import asyncio
+import random
+import time
+
+from fastapi import HTTPException
+from sqlalchemy import create_engine, insert, func, select, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from ..checkout import place_order
+from ..models import Base, CartItems, Carts, ColorProducts, Colors, OrderItems, Products, ProductVariants, Sizes, Users
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def seed(engine, args):
+    rng = random.Random(42)
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {args.schema}"))
+        Base.metadata.create_all(conn)
+
+        conn.execute(insert(Sizes.__table__).values(id=1, name="M"))
+        conn.execute(insert(Colors.__table__).values(id=1, name="Navy", code="NAV", image_url="navy.jpg"))
+        conn.execute(insert(Products.__table__).values(id=1, name="Flash Sale Shirt", reference1="HK00000001"))
+        conn.execute(insert(ColorProducts.__table__).values(id=1, product_id=1, color_id=1))
+        conn.execute(insert(ProductVariants.__table__).values([
+            {"id": i, "stock": args.stock, "product_id": 1, "size_id": 1, "color_products_id": 1, "price": 49.95, "reference2": f"HK{i:08d}"}
+            for i in range(1, args.variants + 1)
+        ]))
+        conn.execute(insert(Users.__table__).values([
+            {"id": i, "title": "Mr", "first_name": "Bench", "last_name": str(i), "gender": "male",
+             "email": f"bench{i}@example.com", "password_hash": "-", "is_admin": False, "remember_token": "-"}
+            for i in range(1, args.users + 1)
+        ]))
+        conn.execute(insert(Carts.__table__).values([
+            {"id": i, "user_id": i, "cart_status": "active"} for i in range(1, args.users + 1)
+        ]))
+        lines = []
+        for cart_id in range(1, args.users + 1):
+            for variant_id in rng.sample(range(1, args.variants + 1), min(args.lines_per_cart, args.variants)):
+                lines.append({"cart_id": cart_id, "product_variant_id": variant_id, "quantity": rng.randint(1, args.max_quantity), "price": 49.95})
+        conn.execute(insert(CartItems.__table__).values(lines))
+        conn.execute(text("ANALYZE"))
+    return sum(line["quantity"] for line in lines)
+
+
+async def run(args):
+    url = make_url(args.database_url).set(drivername="postgresql+asyncpg")
+    engine = create_async_engine(
+        url,
+        pool_size=args.concurrency,
+        max_overflow=0,
+        connect_args={"server_settings": {"search_path": args.schema}}
+    )
+    Session = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    gate = asyncio.Semaphore(args.concurrency)
+    outcomes = {}
+    latencies = []
+
+    async def checkout(user_id):
+        async with gate:
+            started = time.perf_counter()
+            async with Session() as db:
+                try:
+                    await place_order(db, user_id, "1 Savile Row, London")
+                    outcome = 201
+                except HTTPException as e:
+                    outcome = e.status_code
+                except DBAPIError as e:
+                    # Deadlocks and serialization failures would land here
+                    outcome = type(e.orig).__name__
+            latencies.append(time.perf_counter() - started)
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    user_ids = list(range(1, args.users + 1))
+    random.Random(7).shuffle(user_ids)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(checkout(user_id) for user_id in user_ids))
+    elapsed = time.perf_counter() - started
+    await engine.dispose()
+    return elapsed, outcomes, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent checkouts of the same variants")
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--schema", default="bench_checkout")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--variants", type=int, default=5)
+    parser.add_argument("--lines-per-cart", type=int, default=3)
+    parser.add_argument("--max-quantity", type=int, default=2)
+    parser.add_argument("--stock", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--keep", action="store_true", help="leave the scratch schema in place")
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url, connect_args={"options": f"-csearch_path={args.schema}"})
+    demand = seed(engine, args)
+    print(f"{args.users} carts asking for {demand} units of {args.variants} variants with {args.variants * args.stock} in stock")
+
+    elapsed, outcomes, latencies = asyncio.run(run(args))
+
+    print(f"{len(latencies)} checkouts in {elapsed:.2f}s, {len(latencies) / elapsed:.0f}/s")
+    print(f"latency ms  p50 {percentile(latencies, 50) * 1000:.1f}  p95 {percentile(latencies, 95) * 1000:.1f}  "
+          f"p99 {percentile(latencies, 99) * 1000:.1f}  max {max(latencies) * 1000:.1f}")
+    for outcome, count in sorted(outcomes.items(), key=lambda item: str(item[0])):
+        print(f"  {outcome}: {count}")
+
+    with engine.connect() as conn:
+        remaining = dict(conn.execute(select(ProductVariants.id, ProductVariants.stock)).all())
+        ordered = dict(conn.execute(
+            select(OrderItems.product_variant_id, func.sum(OrderItems.quantity)).group_by(OrderItems.product_variant_id)
+        ).all())
+    consistent = True
+    for variant_id, stock in sorted(remaining.items()):
+        sold = args.stock - stock
+        ok = stock >= 0 and sold == ordered.get(variant_id, 0)
+        consistent = consistent and ok
+        print(f"variant {variant_id}: sold {sold}, ordered {ordered.get(variant_id, 0)}, left {stock}{'' if ok else '  MISMATCH'}")
+    print("stock consistent" if consistent else "STOCK INCONSISTENT")
+
+    if not args.keep:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA {args.schema} CASCADE"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# Response serialization cost of list endpoints, per-row pydantic validation versus the
+# orjson fast path in utils.fast_json.
+#
+# Builds real SQLAlchemy result rows shaped like /products/variants (from an in-memory
+# SQLite table, no server needed), serves them from two routes of a throwaway app, one
+# returning the rows through response_model and one through list_response, and times
+# complete requests for each page size.
+#
+#   python -m package.benchmarks.json_serialization --sizes 100 1000 10000 --repeat 30
+import argparse
+import datetime
+import decimal
+import statistics
+import time
+from typing import List
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import Column, BigInteger, DateTime, Integer, MetaData, Numeric, String, Table, create_engine, insert, select
+
+from ..schemas import ProductVariantResponse
+from ..utils.fast_json import dump_rows, list_response
+
+
+def make_rows(count):
+    metadata = MetaData()
+    variants = Table(
+        "variants", metadata,
+        Column("id", Integer, primary_key=True),
+        Column("size_name", String(10)),
+        Column("stock", BigInteger),
+        Column("product_name", String(100)),
+        Column("reference2", String(10)),
+        Column("price", Numeric(10, 2)),
+        Column("color", String(100)),
+        Column("created_at", DateTime(True)),
+        Column("updated_at", DateTime(True)),
+        Column("changed_at", DateTime(True)),
+    )
+    engine = create_engine("sqlite://")
+    metadata.create_all(engine)
+    created = datetime.datetime(2024, 3, 1, 9, 30, tzinfo=datetime.timezone.utc)
+    with engine.begin() as conn:
+        conn.execute(insert(variants), [
+            {
+                "id": i,
+                "size_name": "M",
+                "stock": i % 40,
+                "product_name": f"Slim Fit Oxford Shirt {i // 12}",
+                "reference2": f"V{i:09d}",
+                "price": decimal.Decimal("79.95") + i % 50,
+                "color": "Navy",
+                "created_at": created,
+                "updated_at": created + datetime.timedelta(days=i % 90) if i % 3 else None,
+                "changed_at": created,
+            }
+            for i in range(1, count + 1)
+        ])
+        return conn.execute(select(variants)).all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark list response serialization")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+
+    pages = {size: make_rows(size) for size in args.sizes}
+    app = FastAPI()
+
+    @app.get("/pydantic", response_model=List[ProductVariantResponse])
+    def pydantic_rows(size: int):
+        return pages[size]
+
+    @app.get("/fast", response_model=List[ProductVariantResponse])
+    def fast_rows(size: int):
+        return list_response(pages[size], ProductVariantResponse)
+
+    client = TestClient(app)
+    print(f"{'rows':>6} {'pydantic ms':>12} {'fast ms':>9} {'encode ms':>10} {'speedup':>8}")
+    for size in args.sizes:
+        assert client.get("/pydantic", params={"size": size}).json() == client.get("/fast", params={"size": size}).json()
+        timings = {}
+        for route in ("pydantic", "fast"):
+            samples = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                client.get(f"/{route}", params={"size": size})
+                samples.append((time.perf_counter() - started) * 1000)
+            timings[route] = statistics.median(samples)
+        encode = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            dump_rows(pages[size], ProductVariantResponse)
+            encode.append((time.perf_counter() - started) * 1000)
+        print(f"{size:>6} {timings['pydantic']:>12.2f} {timings['fast']:>9.2f} {statistics.median(encode):>10.2f} "
+              f"{timings['pydantic'] / timings['fast']:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# Login throughput versus catalog latency under a mixed load.
+#
+# Runs login clients and catalog clients side by side against a running server and
+# reports logins per second next to the catalog latency percentiles. Run it once with
+# the catalog clients alone (--login-clients 0) to get the unloaded baseline.
+#
+#   python -m package.benchmarks.login_mixed_load --base-url http://localhost:8000 \
+#       --email bench@example.com --password secret --login-clients 32 --catalog-clients 16
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+async def login_client(client, args, deadline, results):
+    while time.perf_counter() < deadline:
+        response = await client.post("/auth/login", data={"username": args.email, "password": args.password})
+        results[response.status_code] = results.get(response.status_code, 0) + 1
+
+
+async def catalog_client(client, args, deadline, latencies):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        await client.get(args.catalog_path)
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(args):
+    login_results = {}
+    catalog_latencies = []
+    limits = httpx.Limits(max_connections=args.login_clients + args.catalog_clients + 1)
+
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60) as client:
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(
+            *(login_client(client, args, deadline, login_results) for _ in range(args.login_clients)),
+            *(catalog_client(client, args, deadline, catalog_latencies) for _ in range(args.catalog_clients)),
+        )
+
+    logins_ok = login_results.get(200, 0)
+    print(f"duration            {args.duration:.0f}s")
+    print(f"login clients       {args.login_clients}")
+    print(f"logins/s (200)      {logins_ok / args.duration:.1f}")
+    print(f"login status codes  {dict(sorted(login_results.items()))}")
+    print(f"catalog clients     {args.catalog_clients} on {args.catalog_path}")
+    print(f"catalog requests/s  {len(catalog_latencies) / args.duration:.1f}")
+    if catalog_latencies:
+        print(f"catalog mean        {statistics.mean(catalog_latencies) * 1000:.1f} ms")
+        for pct in (50, 95, 99):
+            print(f"catalog p{pct:<3}        {percentile(catalog_latencies, pct) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Login throughput versus catalog latency under a mixed load")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--catalog-path", default="/products/variants?limit=20")
+    parser.add_argument("--login-clients", type=int, default=32)
+    parser.add_argument("--catalog-clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30)
+    asyncio.run(run(parser.parse_args()))
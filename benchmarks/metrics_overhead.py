@@ -0,0 +1,126 @@
+# Cost of recording request metrics.
+#
+# Serves the same routes from two throwaway apps, one with MetricsMiddleware and one without:
+# an async route returning a 48-item listing page, a sync route (run on the threadpool like
+# the sync handlers) and a bare route that does nothing, the worst case. No database needed.
+# Requests are handed straight to the ASGI apps, with no client or transport adding noise,
+# in batches that alternate between the two apps. The median per-request time over the
+# batches is compared. Exits non-zero when the overhead on the listing route is above
+# --max-overhead percent.
+#
+#   python -m package.benchmarks.metrics_overhead --requests 200 --batches 50
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+from fastapi import FastAPI
+
+from ..metrics import MetricsMiddleware, RequestMetrics, render_metrics
+
+PAGE = [
+    {"position": i, "product_id": 1000 + i, "name": f"Oxford Shirt {i}", "price": 79.95, "image_url": f"https://img.example.com/{i}.jpg"}
+    for i in range(48)
+]
+
+
+def make_app(with_metrics):
+    app = FastAPI()
+
+    @app.get("/products/category/{id}")
+    async def listing(id: int):
+        return PAGE
+
+    @app.get("/products/product/{id}")
+    def product(id: int):
+        return PAGE[id % len(PAGE)]
+
+    @app.get("/ping")
+    async def ping():
+        return None
+
+    if with_metrics:
+        app.add_middleware(MetricsMiddleware, metrics=RequestMetrics())
+    return app
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+def scope(path):
+    return {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 50000), "server": ("bench", 80),
+    }
+
+
+async def time_batch(app, path, requests):
+    started = time.perf_counter()
+    for i in range(requests):
+        await app(scope(path.format(id=i % 40)), receive, send)
+    return (time.perf_counter() - started) / requests
+
+
+async def run(args):
+    apps = {"bare": make_app(False), "metrics": make_app(True)}
+    results = {}
+    for path in ("/products/category/{id}", "/products/product/{id}", "/ping"):
+        for app in apps.values():
+            await time_batch(app, path, args.requests)
+        samples = {"bare": [], "metrics": []}
+        for batch in range(args.batches):
+            # Alternate which app goes first, so drift does not favour either
+            order = ["bare", "metrics"] if batch % 2 == 0 else ["metrics", "bare"]
+            for label in order:
+                samples[label].append(await time_batch(apps[label], path, args.requests))
+        results[path] = {label: statistics.median(values) for label, values in samples.items()}
+
+    # Rendering a realistic number of series
+    metrics = RequestMetrics()
+    for route in range(40):
+        for status in (200, 304, 404):
+            metrics.record("GET", f"/route/{route}", status, 0.01)
+    started = time.perf_counter()
+    for _ in range(100):
+        render_metrics(metrics)
+    render_ms = (time.perf_counter() - started) * 10
+
+    return results, render_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the request metrics overhead")
+    parser.add_argument("--requests", type=int, default=200, help="requests per batch")
+    parser.add_argument("--batches", type=int, default=50, help="batches per route and app")
+    parser.add_argument("--max-overhead", type=float, default=5.0, help="allowed overhead on the listing route, in percent")
+    args = parser.parse_args()
+
+    metrics = RequestMetrics()
+    started = time.perf_counter()
+    for i in range(100_000):
+        metrics.record("GET", "/products/category/{id}", 200, i * 1e-6)
+    print(f"record(): {(time.perf_counter() - started) * 10:.2f} us per call")
+
+    results, render_ms = asyncio.run(run(args))
+    print(f"render_metrics() with 120 series: {render_ms:.2f} ms\n")
+
+    print(f"{'route':<26} {'bare us':>9} {'metrics us':>11} {'overhead':>9}")
+    overheads = {}
+    for path, timings in results.items():
+        overheads[path] = (timings["metrics"] - timings["bare"]) / timings["bare"] * 100
+        print(f"{path:<26} {timings['bare'] * 1e6:>9.1f} {timings['metrics'] * 1e6:>11.1f} {overheads[path]:>+8.1f}%")
+
+    if overheads["/products/category/{id}"] > args.max_overhead:
+        print(f"\noverhead on the listing route is above {args.max_overhead}%")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
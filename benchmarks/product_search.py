@@ -0,0 +1,105 @@
+# /products/search query latency over a synthetic catalog.
+#
+# Builds a scratch schema holding only the products table (with its generated
+# search_vector and GIN index), fills it with --products synthetic rows and times the
+# exact query the endpoint runs for queries of different selectivity. The scratch
+# schema is dropped at the end unless --keep is given.
+#
+#   python -m package.benchmarks.product_search --database-url postgresql://... --products 100000
+import argparse
+import random
+import time
+
+from sqlalchemy import create_engine, insert, func, select, text
+
+from ..models import Products
+from ..product_search import to_prefix_tsquery, search_products_query
+
+ADJECTIVES = ["classic", "slim", "regular", "heritage", "washed", "brushed", "striped", "checked", "tailored", "relaxed"]
+FABRICS = ["cotton", "linen", "wool", "cashmere", "denim", "flannel", "oxford", "twill", "merino", "jersey"]
+GARMENTS = ["shirt", "polo", "blazer", "chino", "jumper", "jacket", "coat", "trouser", "tie", "gilet"]
+CARE = "Machine wash at 30 degrees. Do not tumble dry. Iron on a low setting."
+DELIVERY = "Free standard delivery on orders over 100. Returns accepted within 30 days."
+
+QUERIES = [
+    ("common prefix", "sh"),
+    ("two words", "oxford shirt"),
+    ("three words", "slim linen blazer"),
+    ("reference prefix", "hk0001"),
+    ("description word", "mother of pearl"),
+    ("no match", "zzzz"),
+]
+
+
+def synthetic_products(count, seed):
+    rng = random.Random(seed)
+    for i in range(count):
+        adjective, fabric, garment = rng.choice(ADJECTIVES), rng.choice(FABRICS), rng.choice(GARMENTS)
+        details = f"{adjective.title()} {garment} in {fabric}."
+        if rng.random() < 0.05:
+            details += " Finished with mother of pearl buttons."
+        yield {
+            "name": f"{adjective.title()} {fabric.title()} {garment.title()}",
+            "reference1": f"HK{i:08d}",
+            "description_details": details,
+            "description_composition": f"100% {fabric}",
+            "description_care": CARE,
+            "description_delivery": DELIVERY,
+        }
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /products/search over a synthetic catalog")
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--schema", default="bench_product_search")
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--keep", action="store_true", help="leave the scratch schema in place")
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url, connect_args={"options": f"-csearch_path={args.schema}"})
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {args.schema}"))
+        Products.__table__.create(conn)
+
+    start = time.perf_counter()
+    batch = []
+    with engine.begin() as conn:
+        for row in synthetic_products(args.products, seed=42):
+            batch.append(row)
+            if len(batch) == 5000:
+                conn.execute(insert(Products.__table__).values(batch))
+                batch = []
+        if batch:
+            conn.execute(insert(Products.__table__).values(batch))
+        conn.execute(text("ANALYZE products"))
+    print(f"loaded {args.products} products in {time.perf_counter() - start:.1f}s")
+
+    print(f"{'query':<18} {'matches':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    with engine.connect() as conn:
+        for label, q in QUERIES:
+            tsquery = to_prefix_tsquery(q)
+            query = search_products_query(tsquery).limit(args.limit)
+            matches = conn.execute(select(func.count()).select_from(search_products_query(tsquery).subquery())).scalar()
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                conn.execute(query).all()
+                timings.append((time.perf_counter() - started) * 1000)
+            print(f"{label:<18} {matches:>8} {percentile(timings, 50):>8.2f} {percentile(timings, 95):>8.2f} {max(timings):>8.2f}")
+
+    if not args.keep:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA {args.schema} CASCADE"))
+
+
+if __name__ == "__main__":
+    main()
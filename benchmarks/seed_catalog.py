@@ -0,0 +1,246 @@
+# Synthetic shop data at configurable scale, for the benchmark suite.
+#
+# Creates --schema with every table in models.py and fills it through COPY:
+#   - 8 top-level categories with 6 subcategories each, 24 colors, 8 sizes
+#   - one product per 18 variants: 3 colors x 6 sizes, 4 images per color, 1-2 categories
+#   - --users users sharing the password SEED_PASSWORD, user 1 is an admin
+#   - an active cart with 1-5 lines for 40% of the users, an older inactive one for half
+#   - 0-4 orders of 1-4 lines per user
+# then builds the category listing read model and ANALYZEs. Every value is derived from
+# the row ids and --seed, so runs at the same scale produce the same data.
+#
+#   python -m package.benchmarks.seed_catalog --database-url postgresql://... --schema bench --variants 100000
+#
+# Point the app at it with DB_SCHEMA=bench.
+import argparse
+import csv
+import datetime
+import io
+import random
+import time
+from decimal import Decimal
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from ..listing_read_model import refresh_category_listings
+from ..models import Base
+from ..utils.password_hash import hash_password
+
+SEED_PASSWORD = "benchmark-password"
+ADMIN_EMAIL = "bench-admin@example.com"
+
+COLORS_PER_PRODUCT = 3
+SIZES_PER_COLOR = 6
+IMAGES_PER_COLOR = 4
+VARIANTS_PER_PRODUCT = COLORS_PER_PRODUCT * SIZES_PER_COLOR
+TOP_CATEGORIES = 8
+SUBCATEGORIES_PER_TOP = 6
+
+COLOR_NAMES = [
+    "Navy", "White", "Black", "Red", "Green", "Blue", "Grey", "Charcoal", "Camel", "Burgundy", "Olive", "Sky",
+    "Pink", "Stone", "Khaki", "Brown", "Yellow", "Orange", "Teal", "Purple", "Cream", "Mint", "Rust", "Indigo",
+]
+SIZE_NAMES = ["XS", "S", "M", "L", "XL", "XXL", "3XL", "4XL"]
+GARMENTS = ["Shirt", "Polo", "Blazer", "Chino", "Jumper", "Jacket", "Coat", "Trouser", "Tie", "Gilet"]
+FABRICS = ["Cotton", "Linen", "Wool", "Cashmere", "Denim", "Flannel", "Oxford", "Twill", "Merino", "Jersey"]
+
+EPOCH = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def product_price(product_id):
+    return Decimal("19.95") + product_id * 37 % 300
+
+
+def variant_product(variant_id):
+    return (variant_id - 1) // VARIANTS_PER_PRODUCT + 1
+
+
+def product_colors(product_id):
+    return [(product_id * 7 + slot * 5) % len(COLOR_NAMES) + 1 for slot in range(COLORS_PER_PRODUCT)]
+
+
+def timestamp(rng):
+    return EPOCH + datetime.timedelta(seconds=rng.randrange(0, 2 * 365 * 86400))
+
+
+def copy_rows(conn, table, columns, rows, chunk=50_000):
+    cursor = conn.connection.cursor()
+    statement = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % chunk == 0:
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+    buffer.seek(0)
+    cursor.copy_expert(statement, buffer)
+    return count
+
+
+def categories():
+    for top in range(1, TOP_CATEGORIES + 1):
+        yield top, f"Category {top}", 0
+    for top in range(1, TOP_CATEGORIES + 1):
+        for sub in range(SUBCATEGORIES_PER_TOP):
+            category_id = TOP_CATEGORIES + (top - 1) * SUBCATEGORIES_PER_TOP + sub + 1
+            yield category_id, f"Category {top}.{sub + 1}", top
+
+
+def products(count, rng):
+    for product_id in range(1, count + 1):
+        fabric, garment = rng.choice(FABRICS), rng.choice(GARMENTS)
+        details = f"{fabric} {garment.lower()} cut for everyday wear."
+        yield (product_id, f"{fabric} {garment} {product_id}", f"HK{product_id:08d}", details,
+               f"100% {fabric.lower()}", "Machine wash at 30 degrees.", "Free delivery over 100.", timestamp(rng))
+
+
+def category_products(count, rng):
+    subcategories = TOP_CATEGORIES * SUBCATEGORIES_PER_TOP
+    for product_id in range(1, count + 1):
+        first = TOP_CATEGORIES + product_id % subcategories + 1
+        yield product_id, first
+        if rng.random() < 0.3:
+            second = TOP_CATEGORIES + (product_id * 13) % subcategories + 1
+            if second != first:
+                yield product_id, second
+
+
+def color_products(count):
+    for product_id in range(1, count + 1):
+        for slot, color_id in enumerate(product_colors(product_id)):
+            yield (product_id - 1) * COLORS_PER_PRODUCT + slot + 1, product_id, color_id
+
+
+def product_images(count, rng):
+    for color_products_id in range(1, count * COLORS_PER_PRODUCT + 1):
+        for position in range(1, IMAGES_PER_COLOR + 1):
+            yield ((color_products_id - 1) * IMAGES_PER_COLOR + position, color_products_id,
+                   f"https://img.example.com/{color_products_id}/{position}.jpg", position, timestamp(rng))
+
+
+def product_variants(variants, rng):
+    for variant_id in range(1, variants + 1):
+        product_id = variant_product(variant_id)
+        slot, size_slot = divmod((variant_id - 1) % VARIANTS_PER_PRODUCT, SIZES_PER_COLOR)
+        size_id = product_id % (len(SIZE_NAMES) - SIZES_PER_COLOR + 1) + size_slot + 1
+        yield (variant_id, rng.randint(0, 50), product_id, size_id, product_price(product_id),
+               (product_id - 1) * COLORS_PER_PRODUCT + slot + 1, f"V{variant_id:09d}", timestamp(rng),
+               timestamp(rng) if rng.random() < 0.2 else None)
+
+
+def users(count, password_hash, rng):
+    for user_id in range(1, count + 1):
+        email = ADMIN_EMAIL if user_id == 1 else f"bench{user_id}@example.com"
+        yield (user_id, "Mx", "Bench", f"User {user_id}", "other", email, password_hash, user_id == 1, "-", timestamp(rng))
+
+
+def carts_and_orders(user_count, variants, rng):
+    carts, cart_items, orders, order_items = [], [], [], []
+
+    def lines(limit):
+        picked = rng.sample(range(1, variants + 1), min(variants, rng.randint(1, limit)))
+        return [(variant_id, rng.randint(1, 3), product_price(variant_product(variant_id))) for variant_id in sorted(picked)]
+
+    def add_cart(user_id, status):
+        cart_id = len(carts) + 1
+        cart_lines = lines(5)
+        created = timestamp(rng)
+        for variant_id, quantity, price in cart_lines:
+            cart_items.append((len(cart_items) + 1, cart_id, variant_id, quantity, price, created))
+        carts.append((cart_id, user_id, status, created, created, sum(q for _, q, _ in cart_lines), sum(q * p for _, q, p in cart_lines)))
+
+    for user_id in range(1, user_count + 1):
+        if user_id == 1 or rng.random() < 0.4:
+            add_cart(user_id, "active")
+        if rng.random() < 0.5:
+            add_cart(user_id, "inactive")
+        for _ in range(rng.randint(0, 4)):
+            order_id = len(orders) + 1
+            order_lines = lines(4)
+            for variant_id, quantity, price in order_lines:
+                order_items.append((len(order_items) + 1, order_id, variant_id, quantity, price))
+            orders.append((order_id, user_id, "delivered", timestamp(rng), sum(q * p for _, q, p in order_lines), "1 Savile Row, London"))
+    return carts, cart_items, orders, order_items
+
+
+def seed(engine, schema, variants, user_count, seed_value):
+    rng = random.Random(seed_value)
+    product_count = -(-variants // VARIANTS_PER_PRODUCT)
+    variants = product_count * VARIANTS_PER_PRODUCT
+    counts = {}
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {schema}"))
+        Base.metadata.create_all(conn)
+
+        counts["categories"] = copy_rows(conn, "categories", ["id", "name", "parent_id"], categories())
+        counts["colors"] = copy_rows(conn, "colors", ["id", "name", "code", "image_url"], (
+            (i, name, f"C{i:02d}", f"https://img.example.com/colors/{i}.png") for i, name in enumerate(COLOR_NAMES, start=1)
+        ))
+        counts["sizes"] = copy_rows(conn, "sizes", ["id", "name"], enumerate(SIZE_NAMES, start=1))
+        counts["products"] = copy_rows(conn, "products", [
+            "id", "name", "reference1", "description_details", "description_composition", "description_care", "description_delivery", "created_at"
+        ], products(product_count, rng))
+        counts["category_products"] = copy_rows(conn, "category_products", ["product_id", "category_id"], category_products(product_count, rng))
+        counts["color_products"] = copy_rows(conn, "color_products", ["id", "product_id", "color_id"], color_products(product_count))
+        counts["product_images"] = copy_rows(conn, "product_images", ["id", "color_products_id", "image_url", "position", "created_at"], product_images(product_count, rng))
+        counts["product_variants"] = copy_rows(conn, "product_variants", [
+            "id", "stock", "product_id", "size_id", "price", "color_products_id", "reference2", "created_at", "updated_at"
+        ], product_variants(variants, rng))
+
+        counts["users"] = copy_rows(conn, "users", [
+            "id", "title", "first_name", "last_name", "gender", "email", "password_hash", "is_admin", "remember_token", "created_at"
+        ], users(user_count, hash_password(SEED_PASSWORD), rng))
+        counts["password_resets"] = copy_rows(conn, "password_resets", ["id", "user_id", "token"], (
+            (i, user_id, f"reset-{user_id}") for i, user_id in enumerate(range(2, user_count + 1, 50), start=1)
+        ))
+
+        carts, cart_items, orders, order_items = carts_and_orders(user_count, variants, rng)
+        counts["carts"] = copy_rows(conn, "carts", ["id", "user_id", "cart_status", "created_at", "updated_at", "item_count", "subtotal"], carts)
+        counts["cart_items"] = copy_rows(conn, "cart_items", ["id", "cart_id", "product_variant_id", "quantity", "price", "created_at"], cart_items)
+        counts["orders"] = copy_rows(conn, "orders", ["id", "user_id", "order_status", "order_date", "total_amount", "shipping_address"], orders)
+        counts["order_items"] = copy_rows(conn, "order_items", ["id", "order_id", "product_variant_id", "quantity", "price"], order_items)
+
+        # Rows were loaded with explicit ids, move the sequences past them
+        for table in Base.metadata.sorted_tables:
+            if "id" in table.c and table.c.id.primary_key and table.c.id.autoincrement is not False:
+                conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), GREATEST((SELECT max(id) FROM {table.name}), 1))"
+                ))
+
+    with Session(engine) as db:
+        refresh_category_listings(db)
+        db.commit()
+
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("ANALYZE"))
+
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill a schema with synthetic shop data for the benchmark suite")
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--schema", default="bench")
+    parser.add_argument("--variants", type=int, default=100_000, help="e.g. 1000, 100000 or 1000000")
+    parser.add_argument("--users", type=int, help="defaults to one per 100 variants, at least 100")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url, connect_args={"options": f"-csearch_path={args.schema}"})
+    started = time.perf_counter()
+    counts = seed(engine, args.schema, args.variants, args.users or max(100, args.variants // 100), args.seed)
+    for table, count in counts.items():
+        print(f"{table:<20} {count:>10}")
+    print(f"seeded {args.schema} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+# Endpoint benchmark suite over the real app, in process.
+#
+# Drives main.app through httpx's ASGI transport (startup and shutdown hooks included, no
+# server or network) against a Postgres schema filled by seed_catalog. There is no SQLite
+# stand-in: the app relies on Postgres features (DISTINCT ON, tsvector, ON CONFLICT on
+# partial indexes, VALUES joins). Every router is covered: auth, users, products,
+# categories, subcategories, carts and orders. Checkout is left out, it would drain the
+# seeded stock between runs.
+#
+# For each endpoint it sends --requests requests, --concurrency at a time, and reports
+# throughput and latency percentiles. --output writes them as JSON, --compare reads such a
+# file back and exits non-zero when an endpoint's p95 got more than --threshold percent worse.
+# Each endpoint also has a query budget, checked against the Server-Timing header of every
+# response, and the run fails when one is exceeded.
+#
+#   python -m package.benchmarks.seed_catalog --database-url postgresql://... --schema bench --variants 100000
+#   DATABASE_URL=postgresql://... DB_SCHEMA=bench python -m package.benchmarks.suite --output baseline.json
+#   DATABASE_URL=postgresql://... DB_SCHEMA=bench python -m package.benchmarks.suite --compare baseline.json
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import httpx
+from sqlalchemy import func, select
+
+from ..database import DB_ASYNC, SessionLocal
+from ..main import app
+from ..query_stats import query_count
+from ..models import CategoryProductListings, Categories, ColorProducts, Colors, ProductVariants, Products, Users
+from .seed_catalog import ADMIN_EMAIL, SEED_PASSWORD
+
+SAMPLE_SIZE = 500
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+# Ids the requests are drawn from, sampled once from the seeded data
+def sample_ids():
+    with SessionLocal() as db:
+        variants = db.execute(
+            select(ProductVariants.id, ProductVariants.product_id, ProductVariants.size_id, ColorProducts.color_id, Colors.code)
+            .join(ColorProducts, ProductVariants.color_products_id == ColorProducts.id)
+            .join(Colors, ColorProducts.color_id == Colors.id)
+            .order_by(func.random())
+            .limit(SAMPLE_SIZE)
+        ).all()
+        return {
+            "variants": variants,
+            "categories": db.execute(select(Categories.id).filter(Categories.parent_id == 0)).scalars().all(),
+            "listing_categories": db.execute(select(CategoryProductListings.category_id).distinct()).scalars().all(),
+            "search_terms": [name.split()[0].lower()[:4] for name in db.execute(select(Products.name).limit(50)).scalars().all()],
+            "counts": {
+                "product_variants": db.scalar(select(func.count()).select_from(ProductVariants)),
+                "products": db.scalar(select(func.count()).select_from(Products)),
+                "users": db.scalar(select(func.count()).select_from(Users)),
+            },
+        }
+
+
+# (name, share of --requests, query budget, request builder). Builders return (method, url,
+# httpx kwargs). A budget is the most statements one request may run, counting one refill of
+# the principal, catalog version or category tree cache, which any request can hit
+def endpoints(ids, cart_id):
+    rng = random.Random(7)
+    variant = lambda: rng.choice(ids["variants"])
+    listing = lambda: rng.choice(ids["listing_categories"])
+
+    return [
+        ("auth.login", 0.1, 2, lambda: ("POST", "/auth/login", {"data": {"username": ADMIN_EMAIL, "password": SEED_PASSWORD}})),
+        ("auth.users_me", 1, 1, lambda: ("GET", "/auth/users/me", {})),
+        ("auth.users", 0.1, 2, lambda: ("GET", "/auth/users", {})),
+        ("users.update_me", 0.5, 3, lambda: ("PUT", "/users/me", {"json": {"title": "Mx", "first_name": "Bench", "last_name": "User 1", "gender": "other", "email": ADMIN_EMAIL}})),
+        ("products.variants", 1, 2, lambda: ("GET", "/products/variants", {"params": {"limit": 100}})),
+        ("products.variants_updated", 1, 2, lambda: ("GET", "/products/variants", {"params": {"limit": 100, "sort": "updated_at"}})),
+        ("products.variant", 1, 2, lambda: (lambda v: ("GET", "/products/variants/variant", {"params": {"product_id": v.product_id, "size_id": v.size_id, "color_id": v.color_id}}))(variant())),
+        ("products.resolve", 1, 1, lambda: ("POST", "/products/variants/resolve", {"json": {"items": [{"product_variant_id": variant().id} for _ in range(20)]}})),
+        ("products.search", 1, 2, lambda: ("GET", "/products/search", {"params": {"q": rng.choice(ids["search_terms"])}})),
+        ("products.category", 1, 2, lambda: ("GET", f"/products/category/{listing()}", {"params": {"limit": 48}})),
+        ("products.category_sorted", 1, 2, lambda: ("GET", f"/products/category/{listing()}", {"params": {"limit": 48, "sort": "price_asc"}})),
+        ("products.category_filtered", 1, 2, lambda: ("GET", f"/products/category/{listing()}", {"params": {"limit": 48, "size_id": [2, 3], "in_stock": "true"}})),
+        ("products.category_facets", 1, 2, lambda: ("GET", f"/products/category/{listing()}/facets", {})),
+        ("products.product", 1, 2, lambda: ("GET", f"/products/product/{variant().product_id}", {})),
+        ("products.product_details", 1, 5, lambda: ("GET", f"/products/product/{variant().product_id}/details", {})),
+        ("products.images", 1, 2, lambda: (lambda v: ("GET", "/products/product-images", {"params": {"color_code": v.code, "product_id": v.product_id}}))(variant())),
+        ("products.colors", 1, 2, lambda: ("GET", "/products/product-colors", {"params": {"product_id": variant().product_id}})),
+        ("products.sizes", 1, 2, lambda: (lambda v: ("GET", "/products/product-sizes", {"params": {"color_code": v.code, "product_id": v.product_id}}))(variant())),
+        ("categories.list", 1, 1, lambda: ("GET", "/categories/", {})),
+        ("categories.get", 1, 1, lambda: ("GET", f"/categories/{rng.choice(ids['categories'])}", {})),
+        ("subcategories.list", 1, 1, lambda: ("GET", "/subcategories/", {})),
+        ("subcategories.get", 1, 1, lambda: ("GET", f"/subcategories/{rng.choice(ids['categories'])}", {})),
+        ("carts.cart", 1, 2, lambda: ("GET", "/carts/cart", {})),
+        ("carts.items", 1, 3, lambda: ("GET", f"/carts/cart/{cart_id}/cart-items", {})),
+        ("carts.count", 1, 2, lambda: ("GET", f"/carts/cart/{cart_id}/cart-items/count", {})),
+        ("carts.add_item", 1, 4, lambda: (lambda v: ("POST", "/carts/cart/add-cart-item", {"json": {"product_variant_id": v.id, "quantity": 1, "price": 10}}))(variant())),
+        ("carts.add_items", 1, 4, lambda: ("POST", "/carts/cart/add-cart-items", {"json": {"items": [{"product_variant_id": variant().id, "quantity": 1} for _ in range(5)]}})),
+        ("orders.me", 1, 2, lambda: ("GET", "/orders/me", {})),
+        ("orders.me_items", 1, 3, lambda: ("GET", "/orders/me", {"params": {"include": "items"}})),
+    ]
+
+
+async def run_endpoint(client, build, requests, concurrency):
+    latencies = []
+    statuses = {}
+    queries = []
+    queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(build())
+
+    async def worker():
+        while not queue.empty():
+            method, url, kwargs = queue.get_nowait()
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if "server-timing" in response.headers:
+                queries.append(query_count(response))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": requests,
+        "errors": sum(count for status, count in statuses.items() if status >= 400),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "throughput_rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2),
+        "max_queries": max(queries) if queries else None,
+    }
+
+
+async def run(args):
+    ids = sample_ids()
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.post("/auth/login", data={"username": ADMIN_EMAIL, "password": SEED_PASSWORD})
+            response.raise_for_status()
+            client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+            cart = (await client.get("/carts/cart")).json() or (await client.post("/carts/cart")).json()
+
+            for name, share, budget, build in endpoints(ids, cart["id"]):
+                if args.only and not any(name.startswith(prefix) for prefix in args.only):
+                    continue
+                requests = max(args.concurrency, int(args.requests * share))
+                # One untimed round to warm caches and connections
+                await run_endpoint(client, build, args.concurrency, args.concurrency)
+                results[name] = r = await run_endpoint(client, build, requests, args.concurrency)
+                r["query_budget"] = budget
+                over = "  OVER BUDGET" if r["max_queries"] is not None and r["max_queries"] > budget else ""
+                print(f"{name:<28} {r['throughput_rps']:>9.1f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['errors']:>6} "
+                      f"{r['max_queries'] if r['max_queries'] is not None else '-':>7}/{budget}{over}")
+
+    return ids["counts"], results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(baseline, results, threshold):
+    regressions = []
+    print(f"\n{'endpoint':<28} {'base p95':>9} {'p95':>8} {'change':>8} {'base rps':>9} {'rps':>8}")
+    for name, current in results.items():
+        previous = baseline["endpoints"].get(name)
+        if previous is None:
+            continue
+        change = (current["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"] * 100 if previous["p95_ms"] else 0.0
+        flag = "  REGRESSION" if change > threshold else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:<28} {previous['p95_ms']:>9.2f} {current['p95_ms']:>8.2f} {change:>+7.1f}% "
+              f"{previous['throughput_rps']:>9.1f} {current['throughput_rps']:>8.1f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every router of the app in process")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint, some endpoints run a share of it")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--only", nargs="*", help="endpoint name prefixes to run, e.g. products carts.add")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=20.0, help="p95 increase in percent counted as a regression")
+    args = parser.parse_args()
+
+    print(f"{'endpoint':<28} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6} {'queries':>9}")
+    counts, results = asyncio.run(run(args))
+
+    report = {
+        "meta": {
+            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "db_async": DB_ASYNC,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "data": counts,
+        },
+        "endpoints": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failed = False
+    over_budget = [name for name, r in results.items() if r["max_queries"] is not None and r["max_queries"] > r["query_budget"]]
+    if over_budget:
+        print(f"\n{len(over_budget)} endpoints ran more queries than their budget: {', '.join(over_budget)}")
+        failed = True
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("data") != counts:
+            print("note: the baseline was taken on a different data set")
+        regressions = compare(baseline, results, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} endpoints regressed by more than {args.threshold:.0f}%: {', '.join(regressions)}")
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,11 @@
-from fastapi import Depends, APIRouter, HTTPException, status
-from typing import List
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from fastapi import Depends, APIRouter, status
+from sqlalchemy import update, literal_column
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timezone
-from .database import get_db
+from .database import get_async_db
 from .models import Carts, Users, CartItems
-from .schemas import CartResponse, CartItemsResponse, AddItemToCartRequest
+from .schemas import CartItemsResponse, AddItemToCartRequest
 from .auth_routes import get_current_user
 
 cart_item_router = APIRouter(
@@ -13,39 +13,50 @@ cart_item_router = APIRouter(
     tags = ['cart-items']
 )
 
+# Adds the item to the cart in one statement, relying on the unique (cart_id, product_variant_id) index.
+# Concurrent adds of the same variant add up their quantities instead of creating duplicate lines.
+# Returns the resulting line and whether it was newly inserted; the caller commits
+async def upsert_cart_item(db: AsyncSession, cart_id: int, item: AddItemToCartRequest):
+    now = datetime.now(timezone.utc)
+    stmt = insert(CartItems).values(
+        cart_id=cart_id,
+        product_variant_id=item.product_variant_id,
+        quantity=item.quantity,
+        price=item.price,
+        created_at=now
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CartItems.cart_id, CartItems.product_variant_id],
+        set_={"quantity": CartItems.quantity + stmt.excluded.quantity, "updated_at": now}
+    )
+    # xmax is only zero on rows this statement inserted
+    result = await db.execute(stmt.returning(*CartItems.__table__.c, literal_column("(xmax = 0)").label("inserted")))
+    return result.one()
+
+# Applies a change in quantity and value to the totals kept on the cart row. A relative
+# UPDATE, so concurrent mutations of the same cart add up instead of overwriting each other.
+# Also marks the cart as touched, which keeps it away from the cart sweeper
+async def adjust_cart_totals(db: AsyncSession, cart_id: int, item_count: int, subtotal):
+    await db.execute(
+        update(Carts)
+        .where(Carts.id == cart_id)
+        .values(
+            item_count=Carts.item_count + item_count,
+            subtotal=Carts.subtotal + subtotal,
+            updated_at=datetime.now(timezone.utc)
+        )
+    )
+
 @cart_item_router.post("/", response_model=CartItemsResponse, status_code=status.HTTP_201_CREATED)
-def add_item_to_cart(
+async def add_item_to_cart(
     cart_id: int,
     item: AddItemToCartRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: Users = Depends(get_current_user)
 ):
-    cart_item = db.query(CartItems).filter(CartItems.cart_id == cart_id, CartItems.product_variant_id == item.product_variant_id).first()
-    
-    if cart_item:
-        # Update existing cart item if it already exists
-        cart_item.quantity += item.quantity
-        db.add(cart_item)  # Make sure cart_item is added to the session
-    else:
-        # Create a new cart item if it doesn't exist
-        new_cart_item = CartItems(
-            cart_id=cart_id,
-            product_variant_id=item.product_variant_id,
-            quantity=item.quantity,
-            price=item.price
-        )
-        db.add(new_cart_item)
-        cart_item = new_cart_item
-
-    try:
-        db.flush()  # Flush the session to ensure changes are written to the DB
-        db.refresh(cart_item)  # Refresh to get the latest state from the database
-    except Exception as e:
-        # Handle any errors during refresh
-        print(f"Error refreshing cart item: {e}")
-        db.rollback()
-        raise HTTPException(status_code=500, detail="Error refreshing cart item.")
+    cart_item = await upsert_cart_item(db, cart_id, item)
+    await adjust_cart_totals(db, cart_id, item.quantity, item.quantity * cart_item.price)
 
-    db.commit()  # Commit the transaction after refreshing
+    await db.commit()
 
     return cart_item
@@ -1,25 +1,42 @@
 from fastapi import Depends, APIRouter, HTTPException, status
 from typing import List, Optional
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import select, delete, update, text, values, column, literal, BigInteger, DateTime
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timezone
-from .database import get_db
+from .database import get_async_db
 from .models import Carts, Users, CartItems, ProductVariants, Products, ProductImages, ColorProducts, Sizes, Colors
-from .schemas import CartResponse, ItemsInCartResponse, AddItemToCartRequest
+from .schemas import CartResponse, CartItemsResponse, ItemsInCartResponse, AddItemToCartRequest, AddItemsToCartRequest
 from .auth_routes import get_current_user
-from .cart_items_routes import add_item_to_cart
+from .cart_items_routes import upsert_cart_item, adjust_cart_totals
 
 cart_router = APIRouter(
     prefix = '/carts',
     tags = ['carts']
 )
 
+# Returns the id of the user's active cart, creating it if needed, in one statement.
+# The partial unique index on active carts makes concurrent callers converge on the same cart
+async def upsert_active_cart(db: AsyncSession, user_id: int):
+    now = datetime.now(timezone.utc)
+    stmt = insert(Carts).values(user_id=user_id, cart_status='active', created_at=now)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Carts.user_id],
+        # Literal predicate, a bound parameter would not match the partial index during inference
+        index_where=text("cart_status = 'active'"),
+        set_={"updated_at": now}
+    )
+    return await db.scalar(stmt.returning(Carts.id))
+
 @cart_router.get("/cart", response_model=Optional[CartResponse])
-def get_user_active_cart(
-    db: Session = Depends(get_db),
+async def get_user_active_cart(
+    db: AsyncSession = Depends(get_async_db),
     current_user: Users = Depends(get_current_user)
 ):
-    user_active_cart = db.query(Carts).filter(Carts.user_id == current_user.id, Carts.cart_status == 'active').first()
+    # Carries item_count and subtotal, so the badge and cart summary are one lookup
+    # on the active cart index with no aggregation over the lines
+    result = await db.execute(select(Carts).filter(Carts.user_id == current_user.id, Carts.cart_status == 'active'))
+    user_active_cart = result.scalars().first()
 
     if not user_active_cart:
         return None
@@ -28,21 +45,21 @@ def get_user_active_cart(
     return user_active_cart
 
 @cart_router.get("/cart/{cart_id}/cart-items", response_model=List[ItemsInCartResponse])
-def get_cart_items_from_cart(
+async def get_cart_items_from_cart(
     cart_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: Users = Depends(get_current_user)
 ):
-    cart = (
-        db.query(Carts)
+    result = await db.execute(
+        select(Carts)
         .filter(Carts.id == cart_id, Carts.user_id == current_user.id)
-        .first()
     )
+    cart = result.scalars().first()
     if not cart:
         raise HTTPException(status_code=404, detail='Cart not found for this user')
     
-    cart_items = (
-        db.query(CartItems, Products.name.label("product_name"), ProductImages.image_url, Colors.name.label("color"), Sizes.name.label("size"))
+    result = await db.execute(
+        select(CartItems, Products.name.label("product_name"), ProductImages.image_url, Colors.name.label("color"), Sizes.name.label("size"))
         .join(ProductVariants, CartItems.product_variant_id == ProductVariants.id)
         .join(Products, ProductVariants.product_id == Products.id)
         .join(ProductImages, ProductVariants.color_products_id == ProductImages.color_products_id)
@@ -50,8 +67,8 @@ def get_cart_items_from_cart(
         .join(Sizes, ProductVariants.size_id == Sizes.id)
         .join(Colors, ColorProducts.color_id == Colors.id)
         .filter(CartItems.cart_id == cart_id, ProductImages.position == 1)
-        .all()
     )
+    cart_items = result.all()
 
     result = []
     for cart_item, product_name, image_url, color, size in cart_items:
@@ -69,134 +86,173 @@ def get_cart_items_from_cart(
     return result
 
 @cart_router.delete("/cart/{cart_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_cart(
+async def delete_cart(
     cart_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: Users = Depends(get_current_user)
 ):
-    cart = db.query(Carts).filter(Carts.id == cart_id, Carts.user_id == current_user.id).first()
+    result = await db.execute(select(Carts).filter(Carts.id == cart_id, Carts.user_id == current_user.id))
+    cart = result.scalars().first()
 
     if not cart:
         raise HTTPException(status_code=404, detail='Cart not found for this user')
     
     # First delete cart items
-    db.query(CartItems).filter(CartItems.cart_id == cart_id).delete()
+    await db.execute(delete(CartItems).filter(CartItems.cart_id == cart_id))
     
-    db.delete(cart)
-    db.commit()
+    await db.delete(cart)
+    await db.commit()
 
     return 
 
 @cart_router.delete("/cart/{cart_id}/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_item_from_cart(
+async def delete_item_from_cart(
     cart_id: int,
     item_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: Users = Depends(get_current_user)
 ):
-    cart = db.query(Carts).filter(Carts.id == cart_id, Carts.user_id == current_user.id).first()
+    result = await db.execute(select(Carts).filter(Carts.id == cart_id, Carts.user_id == current_user.id))
+    cart = result.scalars().first()
 
     if not cart:
         raise HTTPException(status_code=404, detail='Cart not found for this user')
     
-    # First delete cart items
-    db.query(CartItems).filter(CartItems.id == item_id).delete()
+    result = await db.execute(
+        delete(CartItems)
+        .filter(CartItems.id == item_id, CartItems.cart_id == cart_id)
+        .returning(CartItems.quantity, CartItems.price)
+    )
+    removed = result.first()
+
+    if removed:
+        await adjust_cart_totals(db, cart_id, -removed.quantity, -removed.quantity * removed.price)
     
-    db.commit()
+    await db.commit()
 
     return 
 
 @cart_router.get("/cart/{cart_id}/cart-items/count")
-def count_cart_items(
+async def count_cart_items(
     cart_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: Users = Depends(get_current_user)
 ):
-    cart = db.query(Carts).filter(Carts.id == cart_id, Carts.user_id == current_user.id).first()
+    # Read off the cart row, the ownership check and the count are one indexed lookup
+    total_cart_items = await db.scalar(select(Carts.item_count).filter(Carts.id == cart_id, Carts.user_id == current_user.id))
 
-    if not cart:
+    if total_cart_items is None:
         raise HTTPException(status_code=404, detail='Cart not found for this user')
     
-    total_cart_items = db.query(func.sum(CartItems.quantity)).filter(CartItems.cart_id == cart_id).scalar()
-    
     return {"total_cart_items": total_cart_items or 0}
 
 @cart_router.post("/cart", response_model=CartResponse, status_code=status.HTTP_201_CREATED)
-def create_cart(
-    db: Session = Depends(get_db),
+async def create_cart(
+    db: AsyncSession = Depends(get_async_db),
     current_user: Users = Depends(get_current_user)
 ):
-    existing_cart = db.query(Carts).filter(Carts.user_id == current_user.id, Carts.cart_status == 'active').first()
-
-    if existing_cart:
-        return existing_cart
-    
-    new_cart = Carts(
-        user_id = current_user.id,
-        created_at=datetime.now(timezone.utc)
-    )
+    # Concurrent calls converge on the same active cart instead of creating one each
+    cart_id = await upsert_active_cart(db, current_user.id)
 
-    db.add(new_cart)
-    db.flush()
+    await db.commit()
 
-    db.commit()
-
-    return db.query(Carts).get(new_cart.id)
+    return await db.get(Carts, cart_id)
 
 @cart_router.put("/cart/{cart_id}/cart-status", response_model=CartResponse)
-def update_cart_status(
+async def update_cart_status(
     cart_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: Users = Depends(get_current_user)
 ):
-    cart = db.query(Carts).filter(Carts.id == cart_id, Carts.user_id == current_user.id).first()
+    # One statement on the happy path, ownership and current status are part of the filter
+    result = await db.execute(
+        update(Carts)
+        .where(Carts.id == cart_id, Carts.user_id == current_user.id, Carts.cart_status != 'inactive')
+        .values(cart_status='inactive', updated_at=datetime.now(timezone.utc))
+        .returning(Carts)
+    )
+    cart = result.scalars().first()
 
     if not cart:
-        raise HTTPException(status_code=404, detail='Cart not found for this user')
-    
-    cart_status_to_update = db.query(Carts).filter(Carts.id == cart_id).first()
-
-    if not cart_status_to_update:
-        raise HTTPException(status_code=404, detail='Cart does not exist')
-    
-    if cart_status_to_update.cart_status == 'inactive':
+        cart_status = await db.scalar(select(Carts.cart_status).filter(Carts.id == cart_id, Carts.user_id == current_user.id))
+        if cart_status is None:
+            raise HTTPException(status_code=404, detail='Cart not found for this user')
         raise HTTPException(status_code=200, detail='The cart is already inactive')
 
-    cart_status_to_update.cart_status = 'inactive'
+    await db.commit()
 
-    db.commit()
-
-    return cart_status_to_update
+    return cart
 
 @cart_router.post("/cart/add-cart-item")
-def add_to_cart(
+async def add_to_cart(
     item: AddItemToCartRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: Users = Depends(get_current_user)
 ):   
-    # Get user's active cart
-    user_cart = get_user_active_cart(db, current_user)
-
-    # Create a cart if none exists
-    if not user_cart:
-        create_cart(db, current_user)
-        user_cart = get_user_active_cart(db, current_user)
-
-    # Check if product already exists in the cart
-    existing_item = (
-        db.query(CartItems)
-        .filter(
-            CartItems.cart_id == user_cart.id,
-            CartItems.product_variant_id == item.product_variant_id
+    # Resolve or create the active cart and upsert the line in the same transaction
+    cart_id = await upsert_active_cart(db, current_user.id)
+    cart_item = await upsert_cart_item(db, cart_id, item)
+    # The line keeps its original price when it already existed
+    await adjust_cart_totals(db, cart_id, item.quantity, item.quantity * cart_item.price)
+
+    await db.commit()
+
+    if cart_item.inserted:
+        return {"message": "Item added to cart"}
+    return {"message": "Item quantity updated in cart"}
+
+@cart_router.post("/cart/add-cart-items", response_model=List[CartItemsResponse])
+async def add_items_to_cart(
+    request: AddItemsToCartRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Users = Depends(get_current_user)
+):
+    # Repeated variants are merged, a single upsert cannot touch the same line twice
+    quantities = {}
+    for item in request.items:
+        quantities[item.product_variant_id] = quantities.get(item.product_variant_id, 0) + item.quantity
+
+    cart_id = await upsert_active_cart(db, current_user.id)
+
+    now = datetime.now(timezone.utc)
+    wanted = values(column("product_variant_id", BigInteger), column("quantity", BigInteger), name="wanted").data(list(quantities.items()))
+    # Lines are priced from the variants, and written in variant id order so concurrent
+    # batches on the same cart lock its lines in the same order
+    rows = (
+        select(
+            literal(cart_id, BigInteger),
+            ProductVariants.id,
+            wanted.c.quantity,
+            ProductVariants.price,
+            literal(now, DateTime(True))
         )
-        .first()
+        .select_from(wanted)
+        .join(ProductVariants, ProductVariants.id == wanted.c.product_variant_id)
+        .order_by(ProductVariants.id)
     )
+    stmt = insert(CartItems).from_select(
+        [CartItems.cart_id, CartItems.product_variant_id, CartItems.quantity, CartItems.price, CartItems.created_at],
+        rows
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CartItems.cart_id, CartItems.product_variant_id],
+        set_={"quantity": CartItems.quantity + stmt.excluded.quantity, "updated_at": now}
+    )
+    result = await db.execute(stmt.returning(*CartItems.__table__.c))
+    lines = {line.product_variant_id: line for line in result.all()}
 
-    if existing_item:
-        existing_item.quantity += item.quantity
-        db.commit()
-        return {"message": "Item quantity updated in cart"}
-    
-    # if the product is not found in the cart, add the new cart item
-    add_item_to_cart(cart_id=user_cart.id, item=item, db=db, current_user=current_user)
-    return {"message": "Item added to cart"}
\ No newline at end of file
+    missing = [product_variant_id for product_variant_id in quantities if product_variant_id not in lines]
+    if missing:
+        await db.rollback()
+        raise HTTPException(status_code=404, detail=f'Product variants not found: {missing}')
+
+    await adjust_cart_totals(
+        db,
+        cart_id,
+        sum(quantities.values()),
+        sum(quantity * lines[product_variant_id].price for product_variant_id, quantity in quantities.items())
+    )
+
+    await db.commit()
+
+    return [lines[product_variant_id] for product_variant_id in quantities]
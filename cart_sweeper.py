@@ -0,0 +1,160 @@
+from sqlalchemy import select, insert, delete, func, or_, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from .models import Carts, CartItems, t_carts_archive, t_cart_items_archive
+import argparse
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Seconds between sweeps run inside the app, 0 disables them
+CART_SWEEP_INTERVAL = float(os.getenv("CART_SWEEP_INTERVAL", "0"))
+
+# Active carts untouched for this many days are abandoned
+CART_ABANDONED_AFTER_DAYS = float(os.getenv("CART_ABANDONED_AFTER_DAYS", "30"))
+
+# Inactive (checked out or closed) carts are kept this many days
+CART_INACTIVE_AFTER_DAYS = float(os.getenv("CART_INACTIVE_AFTER_DAYS", "7"))
+
+# "delete" drops swept carts, "archive" moves them to carts_archive / cart_items_archive first
+CART_SWEEP_MODE = os.getenv("CART_SWEEP_MODE", "delete")
+
+# Carts removed per transaction
+CART_SWEEP_BATCH_SIZE = int(os.getenv("CART_SWEEP_BATCH_SIZE", "500"))
+
+CART_COLUMNS = [c.name for c in t_carts_archive.c if c.name != "archived_at"]
+CART_ITEM_COLUMNS = [c.name for c in t_cart_items_archive.c if c.name != "archived_at"]
+
+def stale_carts_condition(now: datetime, abandoned_after: timedelta, inactive_after: timedelta):
+    changed_at = func.coalesce(Carts.updated_at, Carts.created_at)
+    return or_(
+        (Carts.cart_status == 'active') & (changed_at < now - abandoned_after),
+        (Carts.cart_status != 'active') & (changed_at < now - inactive_after)
+    )
+
+# Removes stale carts and their lines in bounded batches. Each batch claims its carts with
+# FOR UPDATE SKIP LOCKED, so carts in use by a request are left for a later sweep and the
+# sweeper never waits on live traffic
+class CartSweeper:
+    def __init__(self, batch_size: int = CART_SWEEP_BATCH_SIZE, mode: str = CART_SWEEP_MODE):
+        if mode not in ("delete", "archive"):
+            raise ValueError(f"Unknown cart sweep mode: {mode}")
+        self.batch_size = batch_size
+        self.mode = mode
+        self._lock = Lock()
+        self.runs = 0
+        self.batches = 0
+        self.carts_removed = 0
+        self.items_removed = 0
+        self.lock_timeouts = 0
+        self.last_run_at = None
+        self.last_run_seconds = None
+        self.last_run_carts = 0
+
+    def sweep_batch(self, db: Session, condition):
+        if db.bind.dialect.name == "postgresql":
+            # Lines can be locked by a request that has not reached the cart row yet,
+            # give up on the batch rather than queue behind it
+            db.execute(text("SET LOCAL lock_timeout = '1s'"))
+
+        cart_ids = db.execute(
+            select(Carts.id)
+            .where(condition)
+            .order_by(Carts.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        ).scalars().all()
+        if not cart_ids:
+            db.rollback()
+            return 0, 0
+
+        if self.mode == "archive":
+            db.execute(insert(t_cart_items_archive).from_select(
+                CART_ITEM_COLUMNS,
+                select(*[CartItems.__table__.c[name] for name in CART_ITEM_COLUMNS]).where(CartItems.cart_id.in_(cart_ids))
+            ))
+            db.execute(insert(t_carts_archive).from_select(
+                CART_COLUMNS,
+                select(*[Carts.__table__.c[name] for name in CART_COLUMNS]).where(Carts.id.in_(cart_ids))
+            ))
+
+        items = db.execute(delete(CartItems).where(CartItems.cart_id.in_(cart_ids))).rowcount
+        carts = db.execute(delete(Carts).where(Carts.id.in_(cart_ids))).rowcount
+        db.commit()
+        return carts, items
+
+    def run_once(self, db: Session, abandoned_after_days: float = CART_ABANDONED_AFTER_DAYS, inactive_after_days: float = CART_INACTIVE_AFTER_DAYS, max_batches: int = None):
+        started = time.perf_counter()
+        now = datetime.now(timezone.utc)
+        condition = stale_carts_condition(now, timedelta(days=abandoned_after_days), timedelta(days=inactive_after_days))
+        run_carts = 0
+        run_items = 0
+        batches = 0
+
+        while max_batches is None or batches < max_batches:
+            try:
+                carts, items = self.sweep_batch(db, condition)
+            except OperationalError:
+                db.rollback()
+                with self._lock:
+                    self.lock_timeouts += 1
+                logger.warning("Cart sweep batch timed out on a lock, stopping until the next run")
+                break
+            if not carts:
+                break
+            batches += 1
+            run_carts += carts
+            run_items += items
+            with self._lock:
+                self.batches += 1
+                self.carts_removed += carts
+                self.items_removed += items
+            logger.info("Swept %d carts and %d cart items (%d carts this run)", carts, items, run_carts)
+            # Only full batches can leave stale carts behind
+            if carts < self.batch_size:
+                break
+
+        with self._lock:
+            self.runs += 1
+            self.last_run_at = now
+            self.last_run_seconds = time.perf_counter() - started
+            self.last_run_carts = run_carts
+        return run_carts, run_items
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "runs": self.runs,
+                "batches": self.batches,
+                "carts_removed": self.carts_removed,
+                "items_removed": self.items_removed,
+                "lock_timeouts": self.lock_timeouts,
+                "last_run_at": self.last_run_at,
+                "last_run_seconds": self.last_run_seconds,
+                "last_run_carts": self.last_run_carts,
+            }
+
+cart_sweeper = CartSweeper()
+
+if __name__ == "__main__":
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Delete or archive abandoned and inactive carts")
+    parser.add_argument("--abandoned-after-days", type=float, default=CART_ABANDONED_AFTER_DAYS, help="age of untouched active carts to sweep")
+    parser.add_argument("--inactive-after-days", type=float, default=CART_INACTIVE_AFTER_DAYS, help="age of inactive carts to sweep")
+    parser.add_argument("--mode", choices=["delete", "archive"], default=CART_SWEEP_MODE)
+    parser.add_argument("--batch-size", type=int, default=CART_SWEEP_BATCH_SIZE)
+    parser.add_argument("--max-batches", type=int, help="stop after this many batches")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    sweeper = CartSweeper(batch_size=args.batch_size, mode=args.mode)
+    with SessionLocal() as db:
+        carts, items = sweeper.run_once(db, args.abandoned_after_days, args.inactive_after_days, args.max_batches)
+    stats = sweeper.stats()
+    print(f"Swept {carts} carts and {items} cart items in {stats['batches']} batches, {stats['last_run_seconds']:.1f}s")
@@ -0,0 +1,419 @@
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError, DataError, IntegrityError
+import psycopg2
+from sqlalchemy.orm import Session
+from decimal import Decimal, InvalidOperation
+from .listing_read_model import refresh_category_listings
+import argparse
+import csv
+import io
+import json
+import time
+
+# Valid rows loaded and merged per transaction
+IMPORT_BATCH_SIZE = 20000
+
+# Errors kept in the report, the count covers all of them
+MAX_REPORTED_ERRORS = 1000
+
+# Upper bound of the bigint stock column
+MAX_STOCK = 2 ** 63 - 1
+
+# One input row per variant. In CSV files category_ids and image_urls are ";" separated,
+# in JSONL they may also be lists. image_urls are in display order
+IMPORT_FIELDS = [
+    "reference1",
+    "product_name",
+    "description_details",
+    "description_composition",
+    "description_care",
+    "description_delivery",
+    "category_ids",
+    "color_code",
+    "reference2",
+    "size",
+    "price",
+    "stock",
+    "image_urls",
+]
+
+VARIANT_COLUMNS = [
+    "line", "reference1", "product_name", "description_details", "description_composition",
+    "description_care", "description_delivery", "color_code", "reference2", "size_name", "price", "stock"
+]
+
+STAGING_TABLES = """
+CREATE TEMP TABLE import_variants (
+    line integer NOT NULL,
+    reference1 varchar(15) NOT NULL,
+    product_name varchar(100) NOT NULL,
+    description_details text,
+    description_composition text,
+    description_care text,
+    description_delivery text,
+    color_code varchar(5) NOT NULL,
+    reference2 varchar(10) NOT NULL,
+    size_name varchar(10) NOT NULL,
+    price numeric(10, 2) NOT NULL,
+    stock bigint NOT NULL
+) ON COMMIT DROP;
+CREATE TEMP TABLE import_images (
+    line integer NOT NULL,
+    reference1 varchar(15) NOT NULL,
+    color_code varchar(5) NOT NULL,
+    position smallint NOT NULL,
+    image_url varchar(255) NOT NULL
+) ON COMMIT DROP;
+CREATE TEMP TABLE import_categories (
+    line integer NOT NULL,
+    reference1 varchar(15) NOT NULL,
+    category_id bigint NOT NULL
+) ON COMMIT DROP;
+CREATE TEMP TABLE import_color_ids ON COMMIT DROP AS
+    SELECT code, min(id) AS id FROM colors GROUP BY code;
+CREATE TEMP TABLE import_size_ids ON COMMIT DROP AS
+    SELECT name, min(id) AS id FROM sizes GROUP BY name;
+"""
+
+# Rows the merge cannot apply, reported and dropped from staging before anything is written
+REJECTED_ROWS = """
+SELECT v.line, v.reference2, 'unknown color code ' || v.color_code
+FROM import_variants v LEFT JOIN import_color_ids c ON c.code = v.color_code
+WHERE c.id IS NULL
+UNION ALL
+SELECT v.line, v.reference2, 'unknown size ' || v.size_name
+FROM import_variants v LEFT JOIN import_size_ids s ON s.name = v.size_name
+WHERE s.id IS NULL
+UNION ALL
+SELECT v.line, v.reference2, 'unknown category ' || ic.category_id
+FROM import_categories ic
+JOIN import_variants v ON v.line = ic.line
+LEFT JOIN categories cat ON cat.id = ic.category_id
+WHERE cat.id IS NULL
+UNION ALL
+SELECT v.line, v.reference2, 'reference2 superseded by line ' || max(later.line)
+FROM import_variants v
+JOIN import_variants later ON later.reference2 = v.reference2 AND later.line > v.line
+GROUP BY v.line, v.reference2
+"""
+
+# Rows that only restate what is stored leave updated_at alone, so reloading a file is a no-op
+MERGE_PRODUCTS = """
+INSERT INTO products (reference1, name, description_details, description_composition, description_care, description_delivery)
+SELECT DISTINCT ON (reference1)
+    reference1, product_name, description_details, description_composition, description_care, description_delivery
+FROM import_variants
+ORDER BY reference1, line DESC
+ON CONFLICT (reference1) DO UPDATE SET
+    name = excluded.name,
+    description_details = excluded.description_details,
+    description_composition = excluded.description_composition,
+    description_care = excluded.description_care,
+    description_delivery = excluded.description_delivery,
+    updated_at = CURRENT_TIMESTAMP
+WHERE (products.name, products.description_details, products.description_composition, products.description_care, products.description_delivery)
+    IS DISTINCT FROM (excluded.name, excluded.description_details, excluded.description_composition, excluded.description_care, excluded.description_delivery)
+"""
+
+MERGE_COLOR_PRODUCTS = """
+INSERT INTO color_products (product_id, color_id)
+SELECT DISTINCT p.id, c.id
+FROM import_variants v
+JOIN products p ON p.reference1 = v.reference1
+JOIN import_color_ids c ON c.code = v.color_code
+ON CONFLICT (product_id, color_id) DO NOTHING
+"""
+
+MERGE_VARIANTS = """
+INSERT INTO product_variants (reference2, product_id, size_id, color_products_id, price, stock)
+SELECT v.reference2, p.id, s.id, cp.id, v.price, v.stock
+FROM import_variants v
+JOIN products p ON p.reference1 = v.reference1
+JOIN import_color_ids c ON c.code = v.color_code
+JOIN color_products cp ON cp.product_id = p.id AND cp.color_id = c.id
+JOIN import_size_ids s ON s.name = v.size_name
+ON CONFLICT (reference2) DO UPDATE SET
+    product_id = excluded.product_id,
+    size_id = excluded.size_id,
+    color_products_id = excluded.color_products_id,
+    price = excluded.price,
+    stock = excluded.stock,
+    updated_at = CURRENT_TIMESTAMP
+WHERE (product_variants.product_id, product_variants.size_id, product_variants.color_products_id, product_variants.price, product_variants.stock)
+    IS DISTINCT FROM (excluded.product_id, excluded.size_id, excluded.color_products_id, excluded.price, excluded.stock)
+"""
+
+# The image list of a (product, color) comes from the last row that gives one; colors
+# without images in the file keep the ones they have
+MERGE_IMAGES = """
+CREATE TEMP TABLE import_image_targets ON COMMIT DROP AS
+SELECT cp.id AS color_products_id, i.position, i.image_url
+FROM import_images i
+JOIN (
+    SELECT reference1, color_code, max(line) AS line FROM import_images GROUP BY reference1, color_code
+) last ON last.reference1 = i.reference1 AND last.color_code = i.color_code AND last.line = i.line
+JOIN products p ON p.reference1 = i.reference1
+JOIN import_color_ids c ON c.code = i.color_code
+JOIN color_products cp ON cp.product_id = p.id AND cp.color_id = c.id;
+
+DELETE FROM product_images pi
+WHERE pi.color_products_id IN (SELECT color_products_id FROM import_image_targets)
+  AND NOT EXISTS (
+      SELECT 1 FROM import_image_targets t
+      WHERE t.color_products_id = pi.color_products_id AND t.position = pi.position AND t.image_url = pi.image_url
+  );
+
+INSERT INTO product_images (color_products_id, position, image_url)
+SELECT t.color_products_id, t.position, t.image_url
+FROM import_image_targets t
+WHERE NOT EXISTS (
+    SELECT 1 FROM product_images pi
+    WHERE pi.color_products_id = t.color_products_id AND pi.position = t.position AND pi.image_url = t.image_url
+);
+"""
+
+MERGE_CATEGORIES = """
+INSERT INTO category_products (product_id, category_id)
+SELECT DISTINCT p.id, ic.category_id
+FROM import_categories ic
+JOIN products p ON p.reference1 = ic.reference1
+WHERE NOT EXISTS (
+    SELECT 1 FROM category_products cp WHERE cp.product_id = p.id AND cp.category_id = ic.category_id
+)
+"""
+
+IMPORTED_PRODUCT_IDS = """
+SELECT DISTINCT p.id FROM import_variants v JOIN products p ON p.reference1 = v.reference1
+"""
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.products_written = 0
+        self.variants_written = 0
+        self.error_count = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    def error(self, line: int, reference2, message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "reference2": reference2, "error": message})
+
+    def as_dict(self):
+        return {
+            "rows": self.rows,
+            "imported": self.imported,
+            "failed": self.error_count,
+            "products_written": self.products_written,
+            "variants_written": self.variants_written,
+            "seconds": round(self.seconds, 3),
+            "rows_per_second": round(self.rows / self.seconds) if self.seconds else None,
+            "errors": self.errors,
+        }
+
+def _text(record: dict, field: str, max_length: int, required: bool = True):
+    value = record.get(field)
+    value = "" if value is None else str(value).strip()
+    if not value:
+        if required:
+            raise ValueError(f"{field} is required")
+        return None
+    if len(value) > max_length:
+        raise ValueError(f"{field} is longer than {max_length} characters")
+    # Postgres text cannot hold NUL, COPY would reject the whole batch
+    if "\x00" in value:
+        raise ValueError(f"{field} contains a NUL character")
+    return value
+
+def _list(record: dict, field: str):
+    value = record.get(field)
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(";")
+    return [str(item).strip() for item in value if str(item).strip()]
+
+# COPY goes through the raw cursor, its failures raise psycopg2 errors instead of SQLAlchemy's
+BATCH_ERRORS = (SQLAlchemyError, psycopg2.Error)
+# Errors caused by the values of some row, worth narrowing down to that row
+ROW_ERRORS = (DataError, IntegrityError, psycopg2.DataError, psycopg2.IntegrityError)
+
+# Checks one input row and splits it into its staging rows, raising ValueError on bad input
+def parse_row(line: int, record: dict):
+    reference1 = _text(record, "reference1", 15)
+    color_code = _text(record, "color_code", 5)
+
+    try:
+        price = Decimal(str(record.get("price")).strip())
+    except InvalidOperation:
+        raise ValueError("price is not a number")
+    if not price.is_finite() or price < 0 or price >= Decimal("100000000"):
+        raise ValueError("price is out of range")
+
+    try:
+        stock = int(str(record.get("stock")).strip())
+    except ValueError:
+        raise ValueError("stock is not an integer")
+    if stock < 0:
+        raise ValueError("stock cannot be negative")
+    if stock > MAX_STOCK:
+        raise ValueError("stock is out of range")
+
+    images = []
+    for position, image_url in enumerate(_list(record, "image_urls"), start=1):
+        if len(image_url) > 255:
+            raise ValueError(f"image {position} is longer than 255 characters")
+        if "\x00" in image_url:
+            raise ValueError(f"image {position} contains a NUL character")
+        images.append((line, reference1, color_code, position, image_url))
+
+    try:
+        categories = [(line, reference1, int(category_id)) for category_id in _list(record, "category_ids")]
+    except ValueError:
+        raise ValueError("category_ids must be integers")
+
+    variant = (
+        line,
+        reference1,
+        _text(record, "product_name", 100),
+        _text(record, "description_details", 1_000_000, required=False),
+        _text(record, "description_composition", 1_000_000, required=False),
+        _text(record, "description_care", 1_000_000, required=False),
+        _text(record, "description_delivery", 1_000_000, required=False),
+        color_code,
+        _text(record, "reference2", 10),
+        _text(record, "size", 10),
+        price,
+        stock,
+    )
+    return variant, images, categories
+
+def read_records(stream, format: str):
+    if format == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+        return
+
+    for line, raw in enumerate(stream, start=1):
+        if not raw.strip():
+            continue
+        try:
+            record = json.loads(raw)
+        except ValueError as e:
+            yield line, e
+            continue
+        yield line, record if isinstance(record, dict) else ValueError("row is not a JSON object")
+
+def _copy(db: Session, table: str, columns, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+# Loads one batch into the staging tables with COPY and merges it into the catalog with
+# set-based statements, in one transaction. The report is only updated once it committed
+def load_batch(db: Session, variants, images, categories, report: ImportReport):
+    db.execute(text(STAGING_TABLES))
+    _copy(db, "import_variants", VARIANT_COLUMNS, variants)
+    _copy(db, "import_images", ["line", "reference1", "color_code", "position", "image_url"], images)
+    _copy(db, "import_categories", ["line", "reference1", "category_id"], categories)
+
+    rejected = db.execute(text(REJECTED_ROWS)).all()
+    if rejected:
+        lines = sorted({line for line, _, _ in rejected})
+        for table in ("import_variants", "import_images", "import_categories"):
+            db.execute(text(f"DELETE FROM {table} WHERE line = ANY(:lines)"), {"lines": lines})
+
+    products_written = db.execute(text(MERGE_PRODUCTS)).rowcount
+    db.execute(text(MERGE_COLOR_PRODUCTS))
+    variants_written = db.execute(text(MERGE_VARIANTS)).rowcount
+    db.execute(text(MERGE_IMAGES))
+    db.execute(text(MERGE_CATEGORIES))
+
+    refresh_category_listings(db, db.execute(text(IMPORTED_PRODUCT_IDS)).scalars().all())
+    db.commit()
+
+    for line, reference2, message in rejected:
+        report.error(line, reference2, message)
+    report.products_written += products_written
+    report.variants_written += variants_written
+    report.imported += len(variants) - len({line for line, _, _ in rejected})
+
+# Loads a batch. When the database rejects a value the batch is split in halves and retried,
+# so the failing rows are reported on their own and the rest still loads. Other database
+# errors fail the batch, and the import goes on with the next one
+def load_batch_isolating_errors(db: Session, variants, images, categories, report: ImportReport):
+    try:
+        load_batch(db, variants, images, categories, report)
+        return
+    except BATCH_ERRORS as e:
+        db.rollback()
+        message = str(getattr(e, "orig", e)).strip().splitlines()[0]
+        if not isinstance(e, ROW_ERRORS) or len(variants) == 1:
+            prefix = "row failed" if len(variants) == 1 else "batch failed"
+            for variant in variants:
+                report.error(variant[0], variant[8], f"{prefix}: {message}")
+            return
+
+    middle = len(variants) // 2
+    for half in (variants[:middle], variants[middle:]):
+        lines = {variant[0] for variant in half}
+        load_batch_isolating_errors(
+            db,
+            half,
+            [image for image in images if image[0] in lines],
+            [category for category in categories if category[0] in lines],
+            report
+        )
+
+# Imports a CSV or JSONL catalog file. Rows that fail validation or cannot be merged are
+# reported with their line number, the rest of the file is still loaded
+def import_catalog(db: Session, stream, format: str, batch_size: int = IMPORT_BATCH_SIZE) -> ImportReport:
+    report = ImportReport()
+    variants, images, categories = [], [], []
+
+    def flush():
+        load_batch_isolating_errors(db, variants, images, categories, report)
+
+    for line, record in read_records(stream, format):
+        report.rows += 1
+        if isinstance(record, Exception):
+            report.error(line, None, str(record))
+            continue
+        try:
+            variant, variant_images, variant_categories = parse_row(line, record)
+        except ValueError as e:
+            report.error(line, record.get("reference2"), str(e))
+            continue
+        variants.append(variant)
+        images.extend(variant_images)
+        categories.extend(variant_categories)
+
+        if len(variants) >= batch_size:
+            flush()
+            variants, images, categories = [], [], []
+
+    if variants:
+        flush()
+
+    report.seconds = time.perf_counter() - report.started
+    return report
+
+if __name__ == "__main__":
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Import products and variants from a CSV or JSONL file")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="defaults to the file extension")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    format = args.format or ("csv" if args.path.endswith(".csv") else "jsonl")
+    with open(args.path, newline="", encoding="utf-8") as stream, SessionLocal() as db:
+        report = import_catalog(db, stream, format, args.batch_size).as_dict()
+    print(json.dumps(report, indent=2))
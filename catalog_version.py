@@ -0,0 +1,61 @@
+from fastapi import Depends, Request, Response
+from sqlalchemy import select, func, DateTime
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import get_async_db
+from .utils.conditional import check_not_modified
+from .models import Categories, CategoryProductListings, Colors, Products, ProductImages, ProductVariants, t_listing_changes
+import hashlib
+import os
+import time
+
+# Seconds a computed catalog version is trusted before the tables are checked again
+CATALOG_VERSION_TTL = float(os.getenv("CATALOG_VERSION_TTL", "5"))
+
+def _changed_at(model):
+    return select(func.max(func.coalesce(model.updated_at, model.created_at))).scalar_subquery()
+
+# Latest change anywhere in the catalog. Every max() is answered from the
+# (coalesce(updated_at, created_at)) indexes, so the check is a handful of index lookups.
+# Deletes and category moves leave no timestamp, they are read from the listing change log
+def catalog_changed_at_query():
+    return select(
+        func.greatest(
+            _changed_at(Products),
+            _changed_at(ProductVariants),
+            _changed_at(ProductImages),
+            _changed_at(Colors),
+            _changed_at(Categories),
+            select(func.max(CategoryProductListings.refreshed_at)).scalar_subquery(),
+            select(func.max(t_listing_changes.c.changed_at)).scalar_subquery(),
+            type_=DateTime(True)
+        )
+    )
+
+# Process-local validator shared by the catalog endpoints, also the key of the facet cache.
+# invalidate() makes the next request check again instead of waiting out the TTL
+class CatalogVersion:
+    def __init__(self, ttl: float = CATALOG_VERSION_TTL):
+        self.ttl = ttl
+        self._checked_at = None
+        self.last_modified = None
+        self.etag = None
+
+    async def ensure_fresh(self, db: AsyncSession):
+        if self._checked_at is not None and time.monotonic() - self._checked_at <= self.ttl:
+            return
+
+        last_modified = await db.scalar(catalog_changed_at_query())
+        stamp = last_modified.isoformat() if last_modified is not None else "empty"
+        self.etag = f'"{hashlib.sha1(stamp.encode()).hexdigest()[:16]}"'
+        self.last_modified = last_modified
+        self._checked_at = time.monotonic()
+
+    def invalidate(self):
+        self._checked_at = None
+
+catalog_version = CatalogVersion()
+
+# Route dependency for catalog GETs, answers revalidations with a 304 before the handler queries anything
+async def catalog_conditional_get(request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+    await catalog_version.ensure_fresh(db)
+    check_not_modified(request, response, catalog_version.etag, catalog_version.last_modified)
@@ -0,0 +1,88 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from threading import Lock
+from .models import Categories
+import hashlib
+import os
+import time
+
+# Seconds a loaded category tree is served before it is read again
+CATEGORY_CACHE_TTL = float(os.getenv("CATEGORY_CACHE_TTL", "300"))
+
+# Process-local copy of the categories table, indexed by id and by parent_id
+class CategoryTree:
+    def __init__(self, ttl: float = CATEGORY_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = Lock()
+        self._loaded_at = None
+        self.version = None
+        self.last_modified = None
+        self.by_id = {}
+        self.by_parent_id = {}
+        self.subcategories = []
+
+    def _build(self, categories):
+        by_id = {}
+        by_parent_id = {}
+        subcategories = []
+        last_modified = None
+        digest = hashlib.sha1()
+
+        for category in sorted(categories, key=lambda c: c.id):
+            node = {"id": category.id, "name": category.name, "parent_id": category.parent_id}
+            by_id[category.id] = node
+            by_parent_id.setdefault(category.parent_id, []).append(node)
+            if category.parent_id != 0:
+                subcategories.append(node)
+            changed_at = category.updated_at or category.created_at
+            if changed_at is not None and (last_modified is None or changed_at > last_modified):
+                last_modified = changed_at
+            digest.update(f"{category.id}|{category.name}|{category.parent_id}|{category.updated_at}\n".encode())
+
+        # Swap the indexes in at once so readers never see a half built tree
+        with self._lock:
+            self.by_id = by_id
+            self.by_parent_id = by_parent_id
+            self.subcategories = subcategories
+            # Derived from the rows, so every worker computes the same stamp
+            self.version = digest.hexdigest()[:16]
+            self.last_modified = last_modified
+            self._loaded_at = time.monotonic()
+
+    def load(self, db: Session):
+        self._build(db.execute(select(Categories)).scalars().all())
+
+    async def load_async(self, db: AsyncSession):
+        result = await db.execute(select(Categories))
+        self._build(result.scalars().all())
+
+    def is_stale(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+
+    async def ensure_fresh(self, db: AsyncSession):
+        if self.is_stale():
+            await self.load_async(db)
+
+    # Forces the next request to read the table again
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    @property
+    def etag(self):
+        return f'"{self.version}"'
+
+    def categories(self):
+        return self.by_parent_id.get(0, [])
+
+    def category(self, id: int):
+        category = self.by_id.get(id)
+        if category is None or category["parent_id"] != 0:
+            return None
+        return category
+
+    def children(self, parent_id: int):
+        return self.by_parent_id.get(parent_id, [])
+
+category_tree = CategoryTree()
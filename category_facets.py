@@ -0,0 +1,196 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from bisect import bisect_left, bisect_right
+from decimal import Decimal
+from typing import List, Optional
+from .models import CategoryProductListings, ColorProducts, Colors, ProductVariants, Sizes
+from .utils.ttl_cache import TTLCache
+import os
+
+# Upper bounds of the price bands reported as facets, the last band is open ended
+FACET_PRICE_BANDS = [Decimal(bound) for bound in os.getenv("FACET_PRICE_BANDS", "50,100,200,500").split(",")]
+
+# Python equivalents of product_routes.LISTING_SORTS for listings served from the index
+LISTING_SORT_KEYS = {
+    "default": lambda e: (e["product_id"], e["color_id"]),
+    "price_asc": lambda e: (e["price"], e["product_id"], e["color_id"]),
+    "price_desc": lambda e: (-e["price"], e["product_id"], e["color_id"]),
+    "newest": lambda e: (-e["product_created_at"].timestamp(), e["product_id"], e["color_id"]),
+    "name": lambda e: (e["product_name"], e["product_id"], e["color_id"]),
+}
+
+def _iter_bits(bits: int):
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+# Filter and facet index of one category listing. Every listing row (product, color) is one bit;
+# rows are numbered in price order so a price range is a contiguous run of bits
+class CategoryFacetIndex:
+    def __init__(self, rows):
+        entries = {}
+        sizes = {}
+        sizes_in_stock = {}
+        self.size_names = {}
+        self.color_names = {}
+
+        for row in rows:
+            key = (row.product_id, row.color_id)
+            if key not in entries:
+                entries[key] = {
+                    "position": row.position,
+                    "image_url": row.image_url,
+                    "product_id": row.product_id,
+                    "color_id": row.color_id,
+                    "color_code": row.color_code,
+                    "color_image_url": row.color_image_url,
+                    "product_name": row.product_name,
+                    "price": row.min_price,
+                    "category_id": row.category_id,
+                    "category_name": row.category_name,
+                    "product_created_at": row.product_created_at
+                }
+                sizes[key] = set()
+                sizes_in_stock[key] = set()
+                self.color_names[row.color_code] = row.color_name
+            if row.size_id is not None:
+                self.size_names[row.size_id] = row.size_name
+                sizes[key].add(row.size_id)
+                if row.stock > 0:
+                    sizes_in_stock[key].add(row.size_id)
+
+        self.entries = sorted(entries.values(), key=LISTING_SORT_KEYS["price_asc"])
+        self.prices = [e["price"] for e in self.entries]
+        self.all_bits = (1 << len(self.entries)) - 1
+        self.by_size = {}
+        self.by_size_in_stock = {}
+        self.by_color = {}
+        self.in_stock = 0
+
+        for i, entry in enumerate(self.entries):
+            bit = 1 << i
+            key = (entry["product_id"], entry["color_id"])
+            self.by_color[entry["color_code"]] = self.by_color.get(entry["color_code"], 0) | bit
+            for size_id in sizes[key]:
+                self.by_size[size_id] = self.by_size.get(size_id, 0) | bit
+            for size_id in sizes_in_stock[key]:
+                self.by_size_in_stock[size_id] = self.by_size_in_stock.get(size_id, 0) | bit
+            if sizes_in_stock[key]:
+                self.in_stock |= bit
+
+    def price_bits(self, min_price: Optional[Decimal], max_price: Optional[Decimal]) -> int:
+        start = bisect_left(self.prices, min_price) if min_price is not None else 0
+        end = bisect_right(self.prices, max_price) if max_price is not None else len(self.prices)
+        if end <= start:
+            return 0
+        return ((1 << end) - 1) ^ ((1 << start) - 1)
+
+    # Values within a facet are OR-ed, facets are AND-ed. exclude leaves one facet out,
+    # which is what the counts of that facet's own values are computed against
+    def match(self, size_ids=None, color_codes=None, min_price=None, max_price=None, in_stock=False, exclude=None) -> int:
+        bits = self.all_bits
+
+        if size_ids and exclude != "size":
+            by_size = self.by_size_in_stock if in_stock and exclude != "in_stock" else self.by_size
+            size_bits = 0
+            for size_id in size_ids:
+                size_bits |= by_size.get(size_id, 0)
+            bits &= size_bits
+        elif in_stock and exclude != "in_stock":
+            bits &= self.in_stock
+
+        if color_codes and exclude != "color":
+            color_bits = 0
+            for code in color_codes:
+                color_bits |= self.by_color.get(code, 0)
+            bits &= color_bits
+
+        if (min_price is not None or max_price is not None) and exclude != "price":
+            bits &= self.price_bits(min_price, max_price)
+
+        return bits
+
+    def entries_for(self, bits: int) -> List[dict]:
+        return [self.entries[i] for i in _iter_bits(bits)]
+
+    def facets(self, size_ids=None, color_codes=None, min_price=None, max_price=None, in_stock=False) -> dict:
+        filters = dict(size_ids=size_ids, color_codes=color_codes, min_price=min_price, max_price=max_price, in_stock=in_stock)
+
+        by_size = self.by_size_in_stock if in_stock else self.by_size
+        size_base = self.match(**filters, exclude="size")
+        color_base = self.match(**filters, exclude="color")
+        price_base = self.match(**filters, exclude="price")
+
+        bounds = [None, *FACET_PRICE_BANDS, None]
+        price_bands = []
+        for low, high in zip(bounds, bounds[1:]):
+            # Bands are [low, high), bisect on the upper bound gives the exclusive end
+            start = bisect_left(self.prices, low) if low is not None else 0
+            end = bisect_left(self.prices, high) if high is not None else len(self.prices)
+            band = ((1 << end) - 1) ^ ((1 << start) - 1) if end > start else 0
+            price_bands.append({"min_price": low, "max_price": high, "count": (price_base & band).bit_count()})
+
+        return {
+            "total": self.match(**filters).bit_count(),
+            "sizes": [
+                {"size_id": size_id, "name": self.size_names[size_id], "count": (size_base & bits).bit_count()}
+                for size_id, bits in sorted(by_size.items())
+            ],
+            "colors": [
+                {"code": code, "name": self.color_names[code], "count": (color_base & bits).bit_count()}
+                for code, bits in sorted(self.by_color.items())
+            ],
+            "price_bands": price_bands,
+            # What the listing would hold with the in-stock filter switched on
+            "in_stock": self.match(**{**filters, "in_stock": True}).bit_count(),
+        }
+
+def facet_rows_query(category_id: int):
+    return (
+        select(
+            CategoryProductListings.category_id,
+            CategoryProductListings.category_name,
+            CategoryProductListings.product_id,
+            CategoryProductListings.product_name,
+            CategoryProductListings.product_created_at,
+            CategoryProductListings.color_id,
+            CategoryProductListings.color_code,
+            CategoryProductListings.color_image_url,
+            CategoryProductListings.image_url,
+            CategoryProductListings.position,
+            CategoryProductListings.min_price,
+            Colors.name.label("color_name"),
+            ProductVariants.size_id,
+            Sizes.name.label("size_name"),
+            ProductVariants.stock
+        )
+        .join(Colors, Colors.id == CategoryProductListings.color_id)
+        .join(ColorProducts, (ColorProducts.product_id == CategoryProductListings.product_id) & (ColorProducts.color_id == CategoryProductListings.color_id))
+        .outerjoin(ProductVariants, ProductVariants.color_products_id == ColorProducts.id)
+        .outerjoin(Sizes, Sizes.id == ProductVariants.size_id)
+        .filter(CategoryProductListings.category_id == category_id)
+    )
+
+# Indexes of recently browsed categories, rebuilt when the catalog version moves
+class CategoryFacetCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, db: AsyncSession, category_id: int, version: str) -> CategoryFacetIndex:
+        cached = self._cache.get(category_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        result = await db.execute(facet_rows_query(category_id))
+        index = CategoryFacetIndex(result.all())
+        self._cache.set(category_id, (version, index))
+        return index
+
+    def stats(self):
+        return self._cache.stats()
+
+category_facets = CategoryFacetCache(
+    maxsize=int(os.getenv("FACET_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("FACET_CACHE_TTL", "600"))
+)
@@ -1,9 +1,12 @@
-from fastapi import Depends, APIRouter, HTTPException, status
+from fastapi import Depends, APIRouter, HTTPException, Request, Response, status
 from typing import List
-from sqlalchemy.orm import Session
-from .database import get_db
-from .models import Categories
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import get_async_db
+from .models import Users
 from .schemas import CategoryResponse
+from .auth_routes import get_current_user
+from .category_cache import category_tree
+from .utils.conditional import check_not_modified
 
 category_router = APIRouter(
     prefix = '/categories',
@@ -11,25 +14,28 @@ category_router = APIRouter(
 )
 
 @category_router.get("/", response_model=List[CategoryResponse])
-def get_categories(db: Session = Depends(get_db)):
-    categories = (
-        db.query(Categories)
-        .where(Categories.parent_id == 0)
-        .all()
-    )
+async def get_categories(request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+    await category_tree.ensure_fresh(db)
+    check_not_modified(request, response, category_tree.etag, category_tree.last_modified)
 
-    return categories
+    return category_tree.categories()
 
 @category_router.get("/{id}", response_model=CategoryResponse)
-def get_category_by_id(id: int, db: Session = Depends(get_db)):
-    category = (
-        db.query(Categories)
-        .where(Categories.parent_id == 0)
-        .filter(Categories.id == id)
-        .first()
-    )
+async def get_category_by_id(id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+    await category_tree.ensure_fresh(db)
+    category = category_tree.category(id)
 
     if category is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
 
-    return category
\ No newline at end of file
+    check_not_modified(request, response, category_tree.etag, category_tree.last_modified)
+    return category
+
+@category_router.post("/cache/invalidate", status_code=status.HTTP_204_NO_CONTENT)
+def invalidate_category_cache(current_user: Users = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access not allowed")
+
+    category_tree.invalidate()
+
+    return
\ No newline at end of file
@@ -0,0 +1,103 @@
+from fastapi import HTTPException
+from sqlalchemy import select, insert, update, values, column, BigInteger
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timezone
+from .models import Carts, CartItems, Orders, OrderItems, ProductVariants
+
+# Turns the user's active cart into an order in one transaction:
+#   1. lock the cart row, so a cart is checked out once and not changed meanwhile
+#   2. lock its variants in id order, so concurrent checkouts of the same variants queue up
+#      instead of deadlocking
+#   3. take the stock with one conditional UPDATE over all lines
+#   4. insert the order and all its lines, priced from the variants
+#   5. close the cart
+# Nothing is written when a line lacks stock, the 409 lists those lines only
+async def place_order(db: AsyncSession, user_id: int, shipping_address: str):
+    cart = await db.scalar(
+        select(Carts)
+        .filter(Carts.user_id == user_id, Carts.cart_status == 'active')
+        .with_for_update()
+    )
+    if not cart:
+        raise HTTPException(status_code=404, detail='User does not have an active cart')
+
+    result = await db.execute(
+        select(CartItems.product_variant_id, CartItems.quantity)
+        .filter(CartItems.cart_id == cart.id)
+        .order_by(CartItems.product_variant_id)
+    )
+    lines = result.all()
+    if not lines:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail='The cart is empty')
+
+    result = await db.execute(
+        select(ProductVariants.id, ProductVariants.stock)
+        .filter(ProductVariants.id.in_([line.product_variant_id for line in lines]))
+        .order_by(ProductVariants.id)
+        .with_for_update()
+    )
+    stock = dict(result.all())
+
+    short = [
+        {"product_variant_id": line.product_variant_id, "requested": line.quantity, "available": stock.get(line.product_variant_id, 0)}
+        for line in lines
+        if stock.get(line.product_variant_id, 0) < line.quantity
+    ]
+    if short:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail={"message": "Insufficient stock", "lines": short})
+
+    now = datetime.now(timezone.utc)
+    wanted = values(column("product_variant_id", BigInteger), column("quantity", BigInteger), name="wanted").data(
+        [(line.product_variant_id, line.quantity) for line in lines]
+    )
+    # The stock condition still guards the decrement, the locks above only make it never fail
+    result = await db.execute(
+        update(ProductVariants)
+        .where(ProductVariants.id == wanted.c.product_variant_id, ProductVariants.stock >= wanted.c.quantity)
+        .values(stock=ProductVariants.stock - wanted.c.quantity, updated_at=now)
+        .returning(ProductVariants.id, ProductVariants.price)
+    )
+    prices = dict(result.all())
+    if len(prices) != len(lines):
+        await db.rollback()
+        raise HTTPException(status_code=409, detail={"message": "Insufficient stock", "lines": [
+            {"product_variant_id": line.product_variant_id, "requested": line.quantity, "available": None}
+            for line in lines
+            if line.product_variant_id not in prices
+        ]})
+
+    total_amount = sum(line.quantity * prices[line.product_variant_id] for line in lines)
+
+    order = (await db.execute(
+        insert(Orders)
+        .values(
+            user_id=user_id,
+            order_status='pending',
+            order_date=now,
+            total_amount=total_amount,
+            shipping_address=shipping_address
+        )
+        .returning(Orders.id, Orders.order_status, Orders.order_date, Orders.total_amount)
+    )).one()
+
+    await db.execute(insert(OrderItems).values([
+        {
+            "order_id": order.id,
+            "product_variant_id": line.product_variant_id,
+            "quantity": line.quantity,
+            "price": prices[line.product_variant_id]
+        }
+        for line in lines
+    ]))
+
+    await db.execute(
+        update(Carts)
+        .where(Carts.id == cart.id)
+        .values(cart_status='inactive', updated_at=now)
+    )
+
+    await db.commit()
+
+    return order
@@ -1,8 +1,17 @@
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from starlette.concurrency import run_in_threadpool
+from threading import Lock
+from bisect import bisect_left
 from .models import Base
+from .query_stats import instrument_engine
+from . import slow_query_log
 from dotenv import load_dotenv
 import os
+import time
 
 # Load environemnt variables into the app
 load_dotenv()
@@ -12,18 +21,185 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_INFO is not set in the .env file!")
 
-engine = create_engine(DATABASE_URL)
+# Switch between the blocking psycopg2 path and the asyncpg path for the async routers
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() in ("1", "true", "yes")
+
+# asyncpg URL, derived from DATABASE_URL unless set explicitly
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or make_url(DATABASE_URL).set(drivername="postgresql+asyncpg")
+
+# Schema every connection is bound to
+DB_SCHEMA = os.getenv("DB_SCHEMA", "hackettshop")
+
+# Pool settings, the defaults are SQLAlchemy's own
+POOL_SETTINGS = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+    "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "-1")),
+    "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "false").lower() in ("1", "true", "yes"),
+}
+
+# Upper bounds, in seconds, of the checkout wait histogram on /metrics
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+
+# Accumulates how long requests waited to get a connection out of a pool
+class PoolWaitStats:
+    def __init__(self):
+        self._lock = Lock()
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.buckets = [0] * (len(POOL_WAIT_BUCKETS) + 1)
+
+    def record(self, seconds):
+        bucket = bisect_left(POOL_WAIT_BUCKETS, seconds)
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += seconds
+            self.max_wait = max(self.max_wait, seconds)
+            self.buckets[bucket] += 1
+
+    # (per-bucket counts, total wait) for the histogram
+    def histogram(self):
+        with self._lock:
+            return list(self.buckets), self.total_wait
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "total_wait_seconds": self.total_wait,
+                "avg_wait_seconds": self.total_wait / self.checkouts if self.checkouts else 0.0,
+                "max_wait_seconds": self.max_wait,
+            }
+
+class _TimedPoolMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.wait_stats.record(time.perf_counter() - start)
+
+    def recreate(self):
+        # Keep the counters when the pool is rebuilt after a disconnect
+        pool = super().recreate()
+        pool.wait_stats = self.wait_stats
+        return pool
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+# Runs once per physical connection instead of once per request
+def set_search_path(dbapi_connection, connection_record):
+    # Outside a transaction, otherwise the pool's reset-on-return would roll it back
+    existing_autocommit = dbapi_connection.autocommit
+    dbapi_connection.autocommit = True
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"SET SESSION search_path TO {DB_SCHEMA}")
+    cursor.close()
+    dbapi_connection.autocommit = existing_autocommit
+
+engine = create_engine(DATABASE_URL, poolclass=TimedQueuePool, **POOL_SETTINGS)
+event.listen(engine, "connect", set_search_path)
+instrument_engine(engine)
+slow_query_log.instrument_engine(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=TimedAsyncQueuePool, **POOL_SETTINGS) if DB_ASYNC else None
+if DB_ASYNC:
+    event.listen(async_engine.sync_engine, "connect", set_search_path)
+    instrument_engine(async_engine.sync_engine)
+    slow_query_log.instrument_engine(async_engine)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False) if DB_ASYNC else None
+
 # This will create the tables if they don’t exist
 def init_db():
     Base.metadata.create_all(bind=engine)
 
-# Dependency to get the database session
+def _pool_stats(pool):
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "timeout": pool.timeout(),
+        **pool.wait_stats.snapshot(),
+    }
+
+# Current state of the connection pools, used to size them against the worker count
+def get_pool_stats():
+    stats = {"sync": _pool_stats(engine.pool)}
+    if DB_ASYNC:
+        stats["async"] = _pool_stats(async_engine.pool)
+    return stats
+
+# Dependency to get the database session. No connection is checked out
+# until the handler runs its first query
 def get_db():
     db = SessionLocal()
-    db.execute(text("SET search_path TO hackettshop;"))
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Exposes the subset of the AsyncSession API used by the async routers on top of a
+# blocking Session, running every database call on the threadpool
+class ThreadedSession:
+    def __init__(self, sync_session):
+        self.sync_session = sync_session
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    def expunge(self, instance):
+        self.sync_session.expunge(instance)
+
+    async def execute(self, statement, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.execute, statement, *args, **kwargs)
+
+    async def scalar(self, statement, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalar, statement, *args, **kwargs)
+
+    async def get(self, entity, ident, **kwargs):
+        return await run_in_threadpool(self.sync_session.get, entity, ident, **kwargs)
+
+    async def delete(self, instance):
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def refresh(self, instance, *args, **kwargs):
+        await run_in_threadpool(self.sync_session.refresh, instance, *args, **kwargs)
+
+    async def flush(self):
+        await run_in_threadpool(self.sync_session.flush)
+
+    async def commit(self):
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def close(self):
+        await run_in_threadpool(self.sync_session.close)
+
+# Dependency to get the session used by the async routers. With DB_ASYNC set it is a
+# real AsyncSession on asyncpg, otherwise the psycopg2 session behind ThreadedSession
+async def get_async_db():
+    if DB_ASYNC:
+        db = AsyncSessionLocal()
+    else:
+        db = ThreadedSession(SessionLocal(expire_on_commit=False))
+    try:
+        yield db
+    finally:
+        await db.close()
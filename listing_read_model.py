@@ -0,0 +1,167 @@
+from sqlalchemy import select, insert, delete, func, union
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from .models import CategoryProductListings, Categories, ColorProducts, Colors, Products, ProductImages, ProductVariants, t_category_products, t_listing_changes
+import argparse
+import os
+
+# Seconds between delta refreshes of the listing read model run inside the app, 0 disables them
+LISTING_REFRESH_INTERVAL = float(os.getenv("LISTING_REFRESH_INTERVAL", "30"))
+# Seconds each delta refresh looks back before the previous run started. Catalog writes stamp
+# rows when their transaction starts but only become visible on commit, a write that committed
+# after a run began is picked up by the next one as long as it took less than this
+LISTING_REFRESH_OVERLAP = float(os.getenv("LISTING_REFRESH_OVERLAP", "120"))
+
+# Entries of the listing change log older than this are deleted by the refresher
+CHANGE_LOG_RETENTION = timedelta(days=1)
+
+# pg_advisory_xact_lock key serializing refreshes across app workers
+REFRESH_LOCK_KEY = 7_201_843
+
+# Product ids refreshed per statement
+REFRESH_BATCH_SIZE = 1000
+
+LISTING_COLUMNS = [
+    CategoryProductListings.category_id,
+    CategoryProductListings.product_id,
+    CategoryProductListings.color_id,
+    CategoryProductListings.category_name,
+    CategoryProductListings.product_name,
+    CategoryProductListings.color_code,
+    CategoryProductListings.color_image_url,
+    CategoryProductListings.image_url,
+    CategoryProductListings.position,
+    CategoryProductListings.min_price,
+    CategoryProductListings.product_created_at,
+]
+
+# One row per (category, product, color) with its primary image, swatch and cheapest variant.
+# The price falls back to the cheapest variant of the product when the color has none of its own
+def listing_rows(product_ids=None):
+    color_prices = select(ProductVariants.color_products_id, func.min(ProductVariants.price).label("min_price"))
+    product_prices = select(ProductVariants.product_id, func.min(ProductVariants.price).label("min_price"))
+    if product_ids is not None:
+        color_prices = color_prices.where(ProductVariants.product_id.in_(product_ids))
+        product_prices = product_prices.where(ProductVariants.product_id.in_(product_ids))
+    color_prices = color_prices.group_by(ProductVariants.color_products_id).subquery()
+    product_prices = product_prices.group_by(ProductVariants.product_id).subquery()
+
+    query = (
+        select(
+            Categories.id,
+            ColorProducts.product_id,
+            Colors.id,
+            Categories.name,
+            Products.name,
+            Colors.code,
+            Colors.image_url,
+            ProductImages.image_url,
+            ProductImages.position,
+            func.coalesce(color_prices.c.min_price, product_prices.c.min_price),
+            Products.created_at
+        )
+        .select_from(ColorProducts)
+        .distinct(Categories.id, ColorProducts.product_id, Colors.id)
+        .join(Products, Products.id == ColorProducts.product_id)
+        .join(Colors, Colors.id == ColorProducts.color_id)
+        .join(ProductImages, ProductImages.color_products_id == ColorProducts.id)
+        .join(t_category_products, t_category_products.c.product_id == ColorProducts.product_id)
+        .join(Categories, Categories.id == t_category_products.c.category_id)
+        .join(product_prices, product_prices.c.product_id == ColorProducts.product_id)
+        .outerjoin(color_prices, color_prices.c.color_products_id == ColorProducts.id)
+        .filter(ProductImages.position == 1)
+        .order_by(Categories.id, ColorProducts.product_id, Colors.id, ProductImages.id)
+    )
+    if product_ids is not None:
+        query = query.filter(ColorProducts.product_id.in_(product_ids))
+
+    return query
+
+# Rebuilds the listing rows of the given products, or of the whole catalog when product_ids is None.
+# Runs as set-based DELETE + INSERT ... SELECT statements, readers keep seeing the old rows until commit
+def refresh_category_listings(db: Session, product_ids=None):
+    if product_ids is None:
+        db.execute(delete(CategoryProductListings))
+        db.execute(insert(CategoryProductListings).from_select(LISTING_COLUMNS, listing_rows()))
+        return
+
+    product_ids = sorted(set(product_ids))
+    for start in range(0, len(product_ids), REFRESH_BATCH_SIZE):
+        batch = product_ids[start:start + REFRESH_BATCH_SIZE]
+        db.execute(delete(CategoryProductListings).where(CategoryProductListings.product_id.in_(batch)))
+        db.execute(insert(CategoryProductListings).from_select(LISTING_COLUMNS, listing_rows(batch)))
+
+# Products whose listing rows may be out of date because they, their variants, images,
+# colors or categories changed at or after since, or a change their timestamps do not show
+# (category membership, deleted or moved variants, images and colors) was logged since
+def changed_product_ids(db: Session, since: datetime):
+    changed = union(
+        select(Products.id)
+        .where(func.coalesce(Products.updated_at, Products.created_at) >= since),
+        select(ProductVariants.product_id)
+        .where(func.coalesce(ProductVariants.updated_at, ProductVariants.created_at) >= since),
+        select(ColorProducts.product_id)
+        .join(ProductImages, ProductImages.color_products_id == ColorProducts.id)
+        .where(func.coalesce(ProductImages.updated_at, ProductImages.created_at) >= since),
+        select(ColorProducts.product_id)
+        .join(Colors, Colors.id == ColorProducts.color_id)
+        .where(func.coalesce(Colors.updated_at, Colors.created_at) >= since),
+        select(t_category_products.c.product_id)
+        .join(Categories, Categories.id == t_category_products.c.category_id)
+        .where(func.coalesce(Categories.updated_at, Categories.created_at) >= since),
+        select(t_listing_changes.c.product_id)
+        .where(t_listing_changes.c.changed_at >= since)
+    )
+    return db.execute(changed).scalars().all()
+
+# Keeps the read model in step with the catalog by refreshing the products changed since its previous run
+class ListingRefresher:
+    def __init__(self):
+        self.last_run = None
+
+    def run_once(self, db: Session):
+        if db.bind.dialect.name == "postgresql":
+            # Workers refreshing the same products at once would insert the same rows twice
+            db.execute(select(func.pg_advisory_xact_lock(REFRESH_LOCK_KEY)))
+        started_at = db.execute(select(func.now())).scalar()
+
+        if self.last_run is None:
+            self.last_run = db.execute(select(func.max(CategoryProductListings.refreshed_at))).scalar()
+
+        if self.last_run is None:
+            # Empty read model, build it from scratch
+            refresh_category_listings(db)
+            refreshed = None
+        else:
+            refreshed = changed_product_ids(db, self.last_run - timedelta(seconds=LISTING_REFRESH_OVERLAP))
+            if refreshed:
+                refresh_category_listings(db, refreshed)
+            db.execute(delete(t_listing_changes).where(t_listing_changes.c.changed_at < started_at - CHANGE_LOG_RETENTION))
+
+        db.commit()
+        self.last_run = started_at
+        return refreshed
+
+listing_refresher = ListingRefresher()
+
+if __name__ == "__main__":
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Refresh the category listing read model")
+    parser.add_argument("--full", action="store_true", help="rebuild every listing row")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="refresh products changed at or after this ISO timestamp")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        if args.full:
+            refresh_category_listings(db)
+            db.commit()
+            print("Rebuilt all listing rows")
+        elif args.since:
+            product_ids = changed_product_ids(db, args.since)
+            refresh_category_listings(db, product_ids)
+            db.commit()
+            print(f"Refreshed {len(product_ids)} products")
+        else:
+            refreshed = listing_refresher.run_once(db)
+            print("Rebuilt all listing rows" if refreshed is None else f"Refreshed {len(refreshed)} products")
@@ -1,7 +1,16 @@
-from fastapi import FastAPI, Depends
-from .database import init_db
+from fastapi import FastAPI, Depends, HTTPException, Request, status
+from fastapi.responses import JSONResponse, Response
+from .database import init_db, get_pool_stats, SessionLocal
+from .query_stats import ServerTimingMiddleware
+from .metrics import MetricsMiddleware, render_metrics, PROMETHEUS_CONTENT_TYPE
+from .slow_query_log import SlowQueryMiddleware, slow_query_log
+from .category_cache import category_tree
+from .listing_read_model import listing_refresher, LISTING_REFRESH_INTERVAL
+from .cart_sweeper import cart_sweeper, CART_SWEEP_INTERVAL
+from .utils.password_hash import password_hasher, PasswordHashingBusy
 from sqlalchemy.orm import Session
-from .auth_routes import auth_router
+from .auth_routes import auth_router, principal_cache, get_current_user
+from .models import Users
 from .user_routes import user_router
 from .product_routes import product_router
 from .category_routes import category_router
@@ -9,25 +18,130 @@ from .subcategory_routes import subcategory_router
 from .order_routes import order_router
 from .cart_routes import cart_router
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+background_tasks = []
+
+def refresh_listings():
+    with SessionLocal() as db:
+        listing_refresher.run_once(db)
+
+# Keeps the category listing read model in step with catalog changes
+async def refresh_listings_periodically():
+    while True:
+        await asyncio.sleep(LISTING_REFRESH_INTERVAL)
+        try:
+            await run_in_threadpool(refresh_listings)
+        except Exception:
+            logger.exception("Category listing refresh failed")
+
+def sweep_carts():
+    with SessionLocal() as db:
+        cart_sweeper.run_once(db)
+
+# Removes abandoned and inactive carts so the cart tables and their indexes stay small
+async def sweep_carts_periodically():
+    while True:
+        await asyncio.sleep(CART_SWEEP_INTERVAL)
+        try:
+            await run_in_threadpool(sweep_carts)
+        except Exception:
+            logger.exception("Cart sweep failed")
+
 @app.on_event("startup")
 def startup():
     init_db()
 
+    # Warm the category tree so the first page loads are served from memory
+    with SessionLocal() as db:
+        category_tree.load(db)
+
+    # Builds the listing read model while it is empty, otherwise catches up on catalog
+    # changes made while the app was down
+    refresh_listings()
+
+    if LISTING_REFRESH_INTERVAL > 0:
+        background_tasks.append(asyncio.get_event_loop().create_task(refresh_listings_periodically()))
+
+    if CART_SWEEP_INTERVAL > 0:
+        background_tasks.append(asyncio.get_event_loop().create_task(sweep_carts_periodically()))
+
+@app.on_event("shutdown")
+def shutdown():
+    for task in background_tasks:
+        task.cancel()
+    password_hasher.shutdown()
+    slow_query_log.shutdown()
+
+# Login spikes are shed here instead of starving the rest of the worker
+@app.exception_handler(PasswordHashingBusy)
+def password_hashing_busy_handler(request: Request, exc: PasswordHashingBusy):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Too many password checks in progress, try again shortly"},
+        headers={"Retry-After": "1"}
+    )
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cross-origin clients page with X-Next-Cursor and revalidate with ETag
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
+app.add_middleware(ServerTimingMiddleware)
+app.add_middleware(SlowQueryMiddleware)
+app.add_middleware(MetricsMiddleware)
+
 @app.get("/")
 def read_root():
     return {"message": "Hello from FastAPI & Docker!"}
 
+@app.get("/pool-stats")
+def read_pool_stats():
+    return get_pool_stats()
+
+@app.get("/sweeper-stats")
+def read_sweeper_stats():
+    return cart_sweeper.stats()
+
+# Async so it renders on the event loop, where the request metrics are recorded
+@app.get("/metrics", include_in_schema=False)
+async def read_metrics():
+    return Response(render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+# Slow statements recorded with SLOW_QUERY_LOG on, with their plans where one was sampled
+@app.get("/slow-queries")
+def read_slow_queries(current_user: Users = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access not allowed")
+
+    return slow_query_log.snapshot()
+
+@app.delete("/slow-queries", status_code=status.HTTP_204_NO_CONTENT)
+def clear_slow_queries(current_user: Users = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access not allowed")
+
+    slow_query_log.clear()
+
+@app.get("/cache-stats")
+def read_cache_stats():
+    return {
+        "principals": principal_cache.stats(),
+        "category_tree_version": category_tree.version,
+        "password_hasher": password_hasher.stats(),
+    }
+
 app.include_router(auth_router)
 app.include_router(user_router)
 app.include_router(product_router)
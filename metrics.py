@@ -0,0 +1,177 @@
+from bisect import bisect_left
+from .database import engine, async_engine, DB_ASYNC, POOL_WAIT_BUCKETS
+import anyio.to_thread
+import os
+import time
+
+# Record request metrics for /metrics. Recording costs a dict lookup and a bisect per request
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Upper bounds, in seconds, of the request latency histogram buckets
+LATENCY_BUCKETS = tuple(float(bound) for bound in os.getenv(
+    "METRICS_LATENCY_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10"
+).split(","))
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Requests that matched no route share one label, raw paths would make the series unbounded
+UNMATCHED_ROUTE = "unmatched"
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # One slot per bucket plus one for values above the last bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+# Request counts, latencies and errors by route template. Recording and rendering both run on
+# the event loop thread, so none of it takes a lock
+class RequestMetrics:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.in_flight = 0
+        # (method, route, status) -> count
+        self.responses = {}
+        # (method, route) -> Histogram
+        self.latency = {}
+        # (method, route, exception class) -> count
+        self.exceptions = {}
+
+    def record(self, method, route, status, seconds):
+        key = (method, route, status)
+        self.responses[key] = self.responses.get(key, 0) + 1
+
+        histogram = self.latency.get((method, route))
+        if histogram is None:
+            histogram = self.latency[(method, route)] = Histogram(self.buckets)
+        histogram.observe(seconds)
+
+    def record_exception(self, method, route, exception):
+        key = (method, route, type(exception).__name__)
+        self.exceptions[key] = self.exceptions.get(key, 0) + 1
+
+request_metrics = RequestMetrics()
+
+# Plain ASGI middleware, the route is read from the scope after the router has matched it
+class MetricsMiddleware:
+    def __init__(self, app, metrics: RequestMetrics = None):
+        self.app = app
+        self.metrics = metrics or request_metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        metrics = self.metrics
+        # An exception before the response started is answered with a 500 further out
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics.in_flight += 1
+        try:
+            await self.app(scope, receive, send_with_status)
+        except Exception as exc:
+            metrics.record_exception(scope["method"], _route_template(scope), exc)
+            raise
+        finally:
+            metrics.in_flight -= 1
+            metrics.record(scope["method"], _route_template(scope), status, time.perf_counter() - started)
+
+def _route_template(scope):
+    route = scope.get("route")
+    return route.path_format if route is not None else UNMATCHED_ROUTE
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(**labels):
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+def _format_bound(bound):
+    return f"{bound:g}"
+
+def _render_histogram(lines, name, labels, bounds, counts, total):
+    cumulative = 0
+    for bound, count in zip(bounds, counts):
+        cumulative += count
+        lines.append(f"{name}_bucket{_labels(**labels, le=_format_bound(bound))} {cumulative}")
+    cumulative += counts[len(bounds)]
+    lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {cumulative}")
+    lines.append(f"{name}_sum{_labels(**labels)} {total}")
+    lines.append(f"{name}_count{_labels(**labels)} {cumulative}")
+
+def _render_requests(lines, metrics: RequestMetrics):
+    lines.append("# HELP http_requests_in_flight Requests being handled.")
+    lines.append("# TYPE http_requests_in_flight gauge")
+    lines.append(f"http_requests_in_flight {metrics.in_flight}")
+
+    lines.append("# HELP http_requests_total Responses by route template and status.")
+    lines.append("# TYPE http_requests_total counter")
+    for (method, route, status), count in sorted(metrics.responses.items()):
+        lines.append(f"http_requests_total{_labels(method=method, route=route, status=status)} {count}")
+
+    lines.append("# HELP http_request_exceptions_total Unhandled exceptions by route template.")
+    lines.append("# TYPE http_request_exceptions_total counter")
+    for (method, route, exception), count in sorted(metrics.exceptions.items()):
+        lines.append(f"http_request_exceptions_total{_labels(method=method, route=route, exception=exception)} {count}")
+
+    lines.append("# HELP http_request_duration_seconds Request latency by route template.")
+    lines.append("# TYPE http_request_duration_seconds histogram")
+    for (method, route), histogram in sorted(metrics.latency.items()):
+        _render_histogram(lines, "http_request_duration_seconds", {"method": method, "route": route},
+                          histogram.bounds, histogram.counts, histogram.sum)
+
+def _render_pools(lines):
+    pools = [("sync", engine.pool)]
+    if DB_ASYNC:
+        pools.append(("async", async_engine.pool))
+
+    for name, help_text, read in [
+        ("db_pool_size", "Connections the pool keeps open.", lambda pool: pool.size()),
+        ("db_pool_checked_out", "Connections in use.", lambda pool: pool.checkedout()),
+        ("db_pool_overflow", "Connections open beyond the pool size.", lambda pool: pool.overflow()),
+    ]:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for label, pool in pools:
+            lines.append(f"{name}{_labels(pool=label)} {read(pool)}")
+
+    lines.append("# HELP db_pool_checkout_wait_seconds Time spent waiting for a pool connection.")
+    lines.append("# TYPE db_pool_checkout_wait_seconds histogram")
+    for label, pool in pools:
+        counts, total = pool.wait_stats.histogram()
+        _render_histogram(lines, "db_pool_checkout_wait_seconds", {"pool": label}, POOL_WAIT_BUCKETS, counts, total)
+
+# Sync handlers and ThreadedSession calls share anyio's default limiter, tasks waiting on it
+# are the threadpool queue
+def _render_threadpool(lines):
+    statistics = anyio.to_thread.current_default_thread_limiter().statistics()
+    for name, help_text, value in [
+        ("threadpool_threads", "Threads the pool may run at once.", statistics.total_tokens),
+        ("threadpool_busy_threads", "Threads running sync handlers or database calls.", statistics.borrowed_tokens),
+        ("threadpool_queue_depth", "Calls waiting for a free thread.", statistics.tasks_waiting),
+    ]:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+
+# Prometheus text exposition of everything above. Must be called from the event loop
+def render_metrics(metrics: RequestMetrics = None):
+    lines = []
+    _render_requests(lines, metrics or request_metrics)
+    _render_pools(lines)
+    _render_threadpool(lines)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,3 @@
+-- Keyset pagination of /products/variants?sort=updated_at
+CREATE INDEX IF NOT EXISTS idx_product_variants_changed_at_id
+    ON hackettshop.product_variants ((COALESCE(updated_at, created_at)), id);
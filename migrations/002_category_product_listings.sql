@@ -0,0 +1,26 @@
+-- Denormalized read model behind /products/category/{id}, one row per (category, product, color).
+-- The app builds it on startup while it is empty, or fill it with: python -m package.listing_read_model --full
+CREATE TABLE IF NOT EXISTS hackettshop.category_product_listings (
+    category_id bigint NOT NULL,
+    product_id bigint NOT NULL,
+    color_id bigint NOT NULL,
+    category_name varchar(45) NOT NULL,
+    product_name varchar(100) NOT NULL,
+    color_code varchar(5) NOT NULL,
+    color_image_url varchar(255) NOT NULL,
+    image_url varchar(255) NOT NULL,
+    position smallint NOT NULL,
+    min_price numeric(10, 2) NOT NULL,
+    product_created_at timestamptz NOT NULL,
+    refreshed_at timestamptz NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT category_product_listings_pkey PRIMARY KEY (category_id, product_id, color_id),
+    CONSTRAINT category_product_listings_ibfk_1 FOREIGN KEY (category_id) REFERENCES hackettshop.categories (id) ON DELETE CASCADE ON UPDATE CASCADE,
+    CONSTRAINT category_product_listings_ibfk_2 FOREIGN KEY (product_id) REFERENCES hackettshop.products (id) ON DELETE CASCADE ON UPDATE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_category_product_listings_product_id
+    ON hackettshop.category_product_listings (product_id);
+CREATE INDEX IF NOT EXISTS idx_category_product_listings_price
+    ON hackettshop.category_product_listings (category_id, min_price);
+CREATE INDEX IF NOT EXISTS idx_category_product_listings_created_at
+    ON hackettshop.category_product_listings (category_id, product_created_at);
@@ -0,0 +1,12 @@
+-- Lets the catalog version (max of coalesce(updated_at, created_at) per table) be read from indexes.
+-- product_variants already has idx_product_variants_changed_at_id from 001
+CREATE INDEX IF NOT EXISTS idx_products_changed_at
+    ON hackettshop.products ((COALESCE(updated_at, created_at)));
+CREATE INDEX IF NOT EXISTS idx_product_images_changed_at
+    ON hackettshop.product_images ((COALESCE(updated_at, created_at)));
+CREATE INDEX IF NOT EXISTS idx_colors_changed_at
+    ON hackettshop.colors ((COALESCE(updated_at, created_at)));
+CREATE INDEX IF NOT EXISTS idx_categories_changed_at
+    ON hackettshop.categories ((COALESCE(updated_at, created_at)));
+CREATE INDEX IF NOT EXISTS idx_category_product_listings_refreshed_at
+    ON hackettshop.category_product_listings (refreshed_at);
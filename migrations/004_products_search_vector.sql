@@ -0,0 +1,13 @@
+-- Inverted index behind /products/search. The column is generated, so Postgres keeps it current on every write
+ALTER TABLE hackettshop.products
+    ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(reference1, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(description_details, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(description_composition, '')), 'C') ||
+        setweight(to_tsvector('simple', coalesce(description_care, '')), 'D') ||
+        setweight(to_tsvector('simple', coalesce(description_delivery, '')), 'D')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_products_search_vector
+    ON hackettshop.products USING gin (search_vector);
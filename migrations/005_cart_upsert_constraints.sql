@@ -0,0 +1,36 @@
+-- One line per (cart, variant) and one active cart per user, so add-to-cart can be a single upsert.
+-- Existing duplicates are merged first.
+BEGIN;
+
+UPDATE hackettshop.cart_items AS kept
+SET quantity = merged.quantity
+FROM (
+    SELECT min(id) AS id, sum(quantity) AS quantity
+    FROM hackettshop.cart_items
+    GROUP BY cart_id, product_variant_id
+    HAVING count(*) > 1
+) AS merged
+WHERE kept.id = merged.id;
+
+DELETE FROM hackettshop.cart_items AS duplicate
+USING hackettshop.cart_items AS kept
+WHERE duplicate.cart_id = kept.cart_id
+  AND duplicate.product_variant_id = kept.product_variant_id
+  AND duplicate.id > kept.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_cart_items_cart_id_product_variant_id
+    ON hackettshop.cart_items (cart_id, product_variant_id);
+
+-- Users with several active carts keep the oldest one active
+UPDATE hackettshop.carts AS newer
+SET cart_status = 'inactive', updated_at = CURRENT_TIMESTAMP
+WHERE newer.cart_status = 'active'
+  AND EXISTS (
+      SELECT 1 FROM hackettshop.carts AS older
+      WHERE older.user_id = newer.user_id AND older.cart_status = 'active' AND older.id < newer.id
+  );
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_carts_one_active_per_user
+    ON hackettshop.carts (user_id) WHERE cart_status = 'active';
+
+COMMIT;
@@ -0,0 +1,18 @@
+-- Running totals on the cart row so the header badge and cart summary need no aggregation.
+-- The application keeps them in step on every cart mutation
+BEGIN;
+
+ALTER TABLE hackettshop.carts
+    ADD COLUMN IF NOT EXISTS item_count bigint NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS subtotal numeric(12, 2) NOT NULL DEFAULT 0;
+
+UPDATE hackettshop.carts AS c
+SET item_count = totals.item_count, subtotal = totals.subtotal
+FROM (
+    SELECT cart_id, sum(quantity) AS item_count, sum(quantity * price) AS subtotal
+    FROM hackettshop.cart_items
+    GROUP BY cart_id
+) AS totals
+WHERE c.id = totals.cart_id;
+
+COMMIT;
@@ -0,0 +1,34 @@
+-- Support for the cart sweeper (python -m package.cart_sweeper): an index to find stale carts
+-- by status and age, and the archive tables used with CART_SWEEP_MODE=archive
+BEGIN;
+
+CREATE INDEX IF NOT EXISTS idx_carts_status_changed_at
+    ON hackettshop.carts (cart_status, (COALESCE(updated_at, created_at)));
+
+CREATE TABLE IF NOT EXISTS hackettshop.carts_archive (
+    id bigint PRIMARY KEY,
+    user_id bigint NOT NULL,
+    cart_status varchar(30) NOT NULL,
+    created_at timestamptz NOT NULL,
+    session_id varchar(100),
+    updated_at timestamptz,
+    item_count bigint NOT NULL,
+    subtotal numeric(12, 2) NOT NULL,
+    archived_at timestamptz NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS hackettshop.cart_items_archive (
+    id bigint PRIMARY KEY,
+    cart_id bigint NOT NULL,
+    product_variant_id bigint NOT NULL,
+    quantity bigint NOT NULL,
+    price numeric(5, 2) NOT NULL,
+    created_at timestamptz NOT NULL,
+    updated_at timestamptz,
+    archived_at timestamptz NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_cart_items_archive_cart_id
+    ON hackettshop.cart_items_archive (cart_id);
+
+COMMIT;
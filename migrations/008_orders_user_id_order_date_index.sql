@@ -0,0 +1,3 @@
+-- Serves the order history keyset, (order_date, id) descending within one user
+CREATE INDEX IF NOT EXISTS idx_orders_user_id_order_date_id
+    ON hackettshop.orders (user_id, order_date, id);
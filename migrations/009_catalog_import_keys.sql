@@ -0,0 +1,36 @@
+-- Natural keys the catalog import (python -m package.catalog_import) upserts on.
+-- Products already have a unique reference1 (idx_16439_reference1)
+BEGIN;
+
+-- Fold duplicate (product, color) rows into the oldest one before making the pair unique
+UPDATE hackettshop.product_variants AS v
+SET color_products_id = d.keep_id
+FROM (
+    SELECT id, min(id) OVER (PARTITION BY product_id, color_id) AS keep_id
+    FROM hackettshop.color_products
+) AS d
+WHERE v.color_products_id = d.id AND d.id <> d.keep_id;
+
+UPDATE hackettshop.product_images AS i
+SET color_products_id = d.keep_id
+FROM (
+    SELECT id, min(id) OVER (PARTITION BY product_id, color_id) AS keep_id
+    FROM hackettshop.color_products
+) AS d
+WHERE i.color_products_id = d.id AND d.id <> d.keep_id;
+
+DELETE FROM hackettshop.color_products AS duplicate
+USING hackettshop.color_products AS kept
+WHERE duplicate.product_id = kept.product_id
+  AND duplicate.color_id = kept.color_id
+  AND duplicate.id > kept.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_color_products_product_id_color_id
+    ON hackettshop.color_products (product_id, color_id);
+
+-- Fails if two variants share a reference2, list them with:
+--   SELECT reference2, array_agg(id) FROM hackettshop.product_variants GROUP BY reference2 HAVING count(*) > 1;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_product_variants_reference2
+    ON hackettshop.product_variants (reference2);
+
+COMMIT;
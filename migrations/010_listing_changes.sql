@@ -0,0 +1,99 @@
+-- Changes the listing refresher cannot see through timestamps: category membership changes,
+-- deleted variants, images and product colors, and rows moved to another product or color.
+-- Triggers log the affected products here, the refresher reads the log and prunes entries
+-- older than a day
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS hackettshop.listing_changes (
+    product_id bigint NOT NULL,
+    changed_at timestamptz NOT NULL DEFAULT clock_timestamp()
+);
+
+CREATE INDEX IF NOT EXISTS idx_listing_changes_changed_at
+    ON hackettshop.listing_changes (changed_at);
+
+-- Statement triggers on tables with a product_id column
+CREATE OR REPLACE FUNCTION hackettshop.log_listing_changes() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO hackettshop.listing_changes (product_id) SELECT DISTINCT product_id FROM new_rows;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO hackettshop.listing_changes (product_id) SELECT DISTINCT product_id FROM old_rows;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Images only know their color_products row, which is gone when the delete cascaded from it.
+-- The color_products trigger logs the product in that case
+CREATE OR REPLACE FUNCTION hackettshop.log_product_image_deletes() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO hackettshop.listing_changes (product_id)
+    SELECT DISTINCT cp.product_id FROM hackettshop.color_products cp JOIN old_rows ON old_rows.color_products_id = cp.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Row triggers on updates of the columns tying a row to its product or color. Transition
+-- tables cannot be combined with a column list, and row triggers with a WHEN clause cost
+-- nothing on the frequent updates, e.g. stock on checkout
+CREATE OR REPLACE FUNCTION hackettshop.log_listing_moves() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'product_images' THEN
+        INSERT INTO hackettshop.listing_changes (product_id)
+        SELECT product_id FROM hackettshop.color_products WHERE id IN (OLD.color_products_id, NEW.color_products_id);
+    ELSE
+        INSERT INTO hackettshop.listing_changes (product_id) VALUES (OLD.product_id), (NEW.product_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Transition tables allow a single event per trigger
+DROP TRIGGER IF EXISTS category_products_log_insert ON hackettshop.category_products;
+CREATE TRIGGER category_products_log_insert AFTER INSERT ON hackettshop.category_products
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION hackettshop.log_listing_changes();
+
+DROP TRIGGER IF EXISTS category_products_log_update ON hackettshop.category_products;
+CREATE TRIGGER category_products_log_update AFTER UPDATE ON hackettshop.category_products
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION hackettshop.log_listing_changes();
+
+DROP TRIGGER IF EXISTS category_products_log_delete ON hackettshop.category_products;
+CREATE TRIGGER category_products_log_delete AFTER DELETE ON hackettshop.category_products
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION hackettshop.log_listing_changes();
+
+DROP TRIGGER IF EXISTS color_products_log_delete ON hackettshop.color_products;
+CREATE TRIGGER color_products_log_delete AFTER DELETE ON hackettshop.color_products
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION hackettshop.log_listing_changes();
+
+DROP TRIGGER IF EXISTS product_variants_log_delete ON hackettshop.product_variants;
+CREATE TRIGGER product_variants_log_delete AFTER DELETE ON hackettshop.product_variants
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION hackettshop.log_listing_changes();
+
+DROP TRIGGER IF EXISTS product_images_log_delete ON hackettshop.product_images;
+CREATE TRIGGER product_images_log_delete AFTER DELETE ON hackettshop.product_images
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION hackettshop.log_product_image_deletes();
+
+DROP TRIGGER IF EXISTS color_products_log_move ON hackettshop.color_products;
+CREATE TRIGGER color_products_log_move AFTER UPDATE OF product_id, color_id ON hackettshop.color_products
+    FOR EACH ROW WHEN (OLD.product_id IS DISTINCT FROM NEW.product_id OR OLD.color_id IS DISTINCT FROM NEW.color_id)
+    EXECUTE FUNCTION hackettshop.log_listing_moves();
+
+DROP TRIGGER IF EXISTS product_variants_log_move ON hackettshop.product_variants;
+CREATE TRIGGER product_variants_log_move AFTER UPDATE OF product_id, color_products_id ON hackettshop.product_variants
+    FOR EACH ROW WHEN (OLD.product_id IS DISTINCT FROM NEW.product_id OR OLD.color_products_id IS DISTINCT FROM NEW.color_products_id)
+    EXECUTE FUNCTION hackettshop.log_listing_moves();
+
+DROP TRIGGER IF EXISTS product_images_log_move ON hackettshop.product_images;
+CREATE TRIGGER product_images_log_move AFTER UPDATE OF color_products_id ON hackettshop.product_images
+    FOR EACH ROW WHEN (OLD.color_products_id IS DISTINCT FROM NEW.color_products_id)
+    EXECUTE FUNCTION hackettshop.log_listing_moves();
+
+COMMIT;
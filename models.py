@@ -1,6 +1,7 @@
 from typing import List, Optional
 
-from sqlalchemy import BigInteger, Boolean, Column, DateTime, ForeignKeyConstraint, Index, Numeric, PrimaryKeyConstraint, SmallInteger, String, Table, Text, text
+from sqlalchemy import DDL, BigInteger, Boolean, Column, Computed, DateTime, ForeignKeyConstraint, Index, Numeric, PrimaryKeyConstraint, SmallInteger, String, Table, Text, event, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 import datetime
 import decimal
@@ -13,6 +14,7 @@ class Categories(Base):
     __tablename__ = 'categories'
     __table_args__ = (
         PrimaryKeyConstraint('id', name='idx_16402_primary'),
+        Index('idx_categories_changed_at', text('COALESCE(updated_at, created_at)'))
     )
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
@@ -29,7 +31,8 @@ class Colors(Base):
     __table_args__ = (
         PrimaryKeyConstraint('id', name='idx_16411_primary'),
         Index('idx_16411_name', 'name', unique=True),
-        Index('idx_16411_name_2', 'name', unique=True)
+        Index('idx_16411_name_2', 'name', unique=True),
+        Index('idx_colors_changed_at', text('COALESCE(updated_at, created_at)'))
     )
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
@@ -59,7 +62,9 @@ class Products(Base):
     __tablename__ = 'products'
     __table_args__ = (
         PrimaryKeyConstraint('id', name='idx_16439_primary'),
-        Index('idx_16439_reference1', 'reference1', unique=True)
+        Index('idx_16439_reference1', 'reference1', unique=True),
+        Index('idx_products_changed_at', text('COALESCE(updated_at, created_at)')),
+        Index('idx_products_search_vector', 'search_vector', postgresql_using='gin')
     )
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
@@ -71,6 +76,20 @@ class Products(Base):
     description_care: Mapped[Optional[str]] = mapped_column(Text)
     description_delivery: Mapped[Optional[str]] = mapped_column(Text)
     updated_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime(True))
+    # Weighted full-text document for /products/search, kept current by Postgres on every write
+    search_vector: Mapped[Optional[str]] = mapped_column(
+        TSVECTOR,
+        Computed(
+            "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(reference1, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(description_details, '')), 'B') || "
+            "setweight(to_tsvector('simple', coalesce(description_composition, '')), 'C') || "
+            "setweight(to_tsvector('simple', coalesce(description_care, '')), 'D') || "
+            "setweight(to_tsvector('simple', coalesce(description_delivery, '')), 'D')",
+            persisted=True
+        ),
+        deferred=True
+    )
 
     category: Mapped[List['Categories']] = relationship('Categories', secondary='category_products', back_populates='product')
     color_products: Mapped[List['ColorProducts']] = relationship('ColorProducts', back_populates='product')
@@ -120,7 +139,9 @@ class Carts(Base):
     __table_args__ = (
         ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='RESTRICT', onupdate='RESTRICT', name='carts_ibfk_1'),
         PrimaryKeyConstraint('id', name='idx_16389_primary'),
-        Index('idx_16389_user_id', 'user_id')
+        Index('idx_16389_user_id', 'user_id'),
+        Index('idx_carts_one_active_per_user', 'user_id', unique=True, postgresql_where=text("cart_status = 'active'")),
+        Index('idx_carts_status_changed_at', 'cart_status', text('COALESCE(updated_at, created_at)'))
     )
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
@@ -129,6 +150,9 @@ class Carts(Base):
     created_at: Mapped[datetime.datetime] = mapped_column(DateTime(True), server_default=text('CURRENT_TIMESTAMP'))
     session_id: Mapped[Optional[str]] = mapped_column(String(100))
     updated_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime(True))
+    # Running totals of the cart lines, maintained by every cart mutation
+    item_count: Mapped[int] = mapped_column(BigInteger, server_default=text('0'))
+    subtotal: Mapped[decimal.Decimal] = mapped_column(Numeric(12, 2), server_default=text('0'))
 
     user: Mapped['Users'] = relationship('Users', back_populates='carts')
     cart_items: Mapped[List['CartItems']] = relationship('CartItems', back_populates='cart')
@@ -145,6 +169,45 @@ t_category_products = Table(
 )
 
 
+# Products whose listing rows changed in ways their timestamps do not show, logged by the
+# triggers at the end of this module for the listing refresher
+t_listing_changes = Table(
+    'listing_changes', Base.metadata,
+    Column('product_id', BigInteger, nullable=False),
+    Column('changed_at', DateTime(True), nullable=False, server_default=text('clock_timestamp()')),
+    Index('idx_listing_changes_changed_at', 'changed_at')
+)
+
+
+# Carts removed by the cart sweeper in archive mode, with the time they were moved
+t_carts_archive = Table(
+    'carts_archive', Base.metadata,
+    Column('id', BigInteger, primary_key=True),
+    Column('user_id', BigInteger, nullable=False),
+    Column('cart_status', String(30), nullable=False),
+    Column('created_at', DateTime(True), nullable=False),
+    Column('session_id', String(100)),
+    Column('updated_at', DateTime(True)),
+    Column('item_count', BigInteger, nullable=False),
+    Column('subtotal', Numeric(12, 2), nullable=False),
+    Column('archived_at', DateTime(True), nullable=False, server_default=text('CURRENT_TIMESTAMP'))
+)
+
+
+t_cart_items_archive = Table(
+    'cart_items_archive', Base.metadata,
+    Column('id', BigInteger, primary_key=True),
+    Column('cart_id', BigInteger, nullable=False),
+    Column('product_variant_id', BigInteger, nullable=False),
+    Column('quantity', BigInteger, nullable=False),
+    Column('price', Numeric(5, 2), nullable=False),
+    Column('created_at', DateTime(True), nullable=False),
+    Column('updated_at', DateTime(True)),
+    Column('archived_at', DateTime(True), nullable=False, server_default=text('CURRENT_TIMESTAMP')),
+    Index('idx_cart_items_archive_cart_id', 'cart_id')
+)
+
+
 class ColorProducts(Base):
     __tablename__ = 'color_products'
     __table_args__ = (
@@ -152,7 +215,8 @@ class ColorProducts(Base):
         ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE', onupdate='RESTRICT', name='color_products_ibfk_2'),
         PrimaryKeyConstraint('id', name='idx_16417_primary'),
         Index('idx_16417_color_id', 'color_id'),
-        Index('idx_16417_color_products_ibfk_2', 'product_id')
+        Index('idx_16417_color_products_ibfk_2', 'product_id'),
+        Index('idx_color_products_product_id_color_id', 'product_id', 'color_id', unique=True)
     )
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
@@ -170,7 +234,8 @@ class Orders(Base):
     __table_args__ = (
         ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='RESTRICT', onupdate='RESTRICT', name='orders_ibfk_1'),
         PrimaryKeyConstraint('id', name='idx_16422_primary'),
-        Index('idx_16422_user_id', 'user_id')
+        Index('idx_16422_user_id', 'user_id'),
+        Index('idx_orders_user_id_order_date_id', 'user_id', 'order_date', 'id')
     )
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
@@ -189,7 +254,8 @@ class ProductImages(Base):
     __table_args__ = (
         ForeignKeyConstraint(['color_products_id'], ['color_products.id'], ondelete='CASCADE', onupdate='RESTRICT', name='product_images_ibfk_1'),
         PrimaryKeyConstraint('id', name='idx_16447_primary'),
-        Index('idx_16447_product_images_ibfk_1', 'color_products_id')
+        Index('idx_16447_product_images_ibfk_1', 'color_products_id'),
+        Index('idx_product_images_changed_at', text('COALESCE(updated_at, created_at)'))
     )
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
@@ -211,7 +277,9 @@ class ProductVariants(Base):
         PrimaryKeyConstraint('id', name='idx_16453_primary'),
         Index('idx_16453_color_products_id', 'color_products_id'),
         Index('idx_16453_product_id', 'product_id'),
-        Index('idx_16453_size_id', 'size_id')
+        Index('idx_16453_size_id', 'size_id'),
+        Index('idx_product_variants_changed_at_id', text('COALESCE(updated_at, created_at)'), 'id'),
+        Index('idx_product_variants_reference2', 'reference2', unique=True)
     )
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
@@ -238,7 +306,8 @@ class CartItems(Base):
         ForeignKeyConstraint(['product_variant_id'], ['product_variants.id'], ondelete='CASCADE', onupdate='RESTRICT', name='cart_items_ibfk_2'),
         PrimaryKeyConstraint('id', name='idx_16396_primary'),
         Index('idx_16396_cart_id', 'cart_id'),
-        Index('idx_16396_cart_items_ibfk_2', 'product_variant_id')
+        Index('idx_16396_cart_items_ibfk_2', 'product_variant_id'),
+        Index('idx_cart_items_cart_id_product_variant_id', 'cart_id', 'product_variant_id', unique=True)
     )
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
@@ -271,3 +340,105 @@ class OrderItems(Base):
 
     order: Mapped['Orders'] = relationship('Orders', back_populates='order_items')
     product_variant: Mapped['ProductVariants'] = relationship('ProductVariants', back_populates='order_items')
+
+
+class CategoryProductListings(Base):
+    __tablename__ = 'category_product_listings'
+    __table_args__ = (
+        ForeignKeyConstraint(['category_id'], ['categories.id'], ondelete='CASCADE', onupdate='CASCADE', name='category_product_listings_ibfk_1'),
+        ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE', onupdate='CASCADE', name='category_product_listings_ibfk_2'),
+        PrimaryKeyConstraint('category_id', 'product_id', 'color_id', name='category_product_listings_pkey'),
+        Index('idx_category_product_listings_product_id', 'product_id'),
+        Index('idx_category_product_listings_price', 'category_id', 'min_price'),
+        Index('idx_category_product_listings_created_at', 'category_id', 'product_created_at'),
+        Index('idx_category_product_listings_refreshed_at', 'refreshed_at')
+    )
+
+    category_id: Mapped[int] = mapped_column(BigInteger)
+    product_id: Mapped[int] = mapped_column(BigInteger)
+    color_id: Mapped[int] = mapped_column(BigInteger)
+    category_name: Mapped[str] = mapped_column(String(45))
+    product_name: Mapped[str] = mapped_column(String(100))
+    color_code: Mapped[str] = mapped_column(String(5))
+    color_image_url: Mapped[str] = mapped_column(String(255))
+    image_url: Mapped[str] = mapped_column(String(255))
+    position: Mapped[int] = mapped_column(SmallInteger)
+    min_price: Mapped[decimal.Decimal] = mapped_column(Numeric(10, 2))
+    product_created_at: Mapped[datetime.datetime] = mapped_column(DateTime(True))
+    refreshed_at: Mapped[datetime.datetime] = mapped_column(DateTime(True), server_default=text('CURRENT_TIMESTAMP'))
+
+
+# Same functions and triggers as migrations/010_listing_changes.sql, for schemas built with
+# create_all. The functions are (re)created before each table that uses them
+LISTING_CHANGE_FUNCTIONS = [
+    """
+CREATE OR REPLACE FUNCTION log_listing_changes() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO listing_changes (product_id) SELECT DISTINCT product_id FROM new_rows;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO listing_changes (product_id) SELECT DISTINCT product_id FROM old_rows;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+""",
+    """
+CREATE OR REPLACE FUNCTION log_product_image_deletes() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO listing_changes (product_id)
+    SELECT DISTINCT cp.product_id FROM color_products cp JOIN old_rows ON old_rows.color_products_id = cp.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+""",
+    """
+CREATE OR REPLACE FUNCTION log_listing_moves() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'product_images' THEN
+        INSERT INTO listing_changes (product_id)
+        SELECT product_id FROM color_products WHERE id IN (OLD.color_products_id, NEW.color_products_id);
+    ELSE
+        INSERT INTO listing_changes (product_id) VALUES (OLD.product_id), (NEW.product_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+""",
+]
+
+def _statement_trigger(name, operation, transition_tables, function):
+    return (f'CREATE TRIGGER {name} AFTER {operation} ON %(table)s '
+            f'REFERENCING {transition_tables} FOR EACH STATEMENT EXECUTE FUNCTION {function}()')
+
+def _move_trigger(name, columns):
+    changed = ' OR '.join(f'OLD.{column} IS DISTINCT FROM NEW.{column}' for column in columns)
+    return (f'CREATE TRIGGER {name} AFTER UPDATE OF {", ".join(columns)} ON %(table)s '
+            f'FOR EACH ROW WHEN ({changed}) EXECUTE FUNCTION log_listing_moves()')
+
+LISTING_CHANGE_TRIGGERS = {
+    t_category_products: [
+        _statement_trigger('category_products_log_insert', 'INSERT', 'NEW TABLE AS new_rows', 'log_listing_changes'),
+        _statement_trigger('category_products_log_update', 'UPDATE', 'OLD TABLE AS old_rows NEW TABLE AS new_rows', 'log_listing_changes'),
+        _statement_trigger('category_products_log_delete', 'DELETE', 'OLD TABLE AS old_rows', 'log_listing_changes'),
+    ],
+    ColorProducts.__table__: [
+        _statement_trigger('color_products_log_delete', 'DELETE', 'OLD TABLE AS old_rows', 'log_listing_changes'),
+        _move_trigger('color_products_log_move', ['product_id', 'color_id']),
+    ],
+    ProductVariants.__table__: [
+        _statement_trigger('product_variants_log_delete', 'DELETE', 'OLD TABLE AS old_rows', 'log_listing_changes'),
+        _move_trigger('product_variants_log_move', ['product_id', 'color_products_id']),
+    ],
+    ProductImages.__table__: [
+        _statement_trigger('product_images_log_delete', 'DELETE', 'OLD TABLE AS old_rows', 'log_product_image_deletes'),
+        _move_trigger('product_images_log_move', ['color_products_id']),
+    ],
+}
+
+for table, triggers in LISTING_CHANGE_TRIGGERS.items():
+    for function in LISTING_CHANGE_FUNCTIONS:
+        event.listen(table, 'before_create', DDL(function).execute_if(dialect='postgresql'))
+    for trigger in triggers:
+        event.listen(table, 'after_create', DDL(trigger).execute_if(dialect='postgresql'))
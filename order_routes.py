@@ -1,38 +1,93 @@
-from fastapi import Depends, APIRouter, HTTPException, status
-from typing import List
-from sqlalchemy.orm import Session
-from .database import get_db
-from .models import Orders, Users
-from .schemas import OrderResponse
+from fastapi import Depends, APIRouter, HTTPException, Query, Response, status
+from typing import List, Literal, Optional
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from .database import get_async_db
+from .models import Orders, OrderItems, Users, ProductVariants, Products, Sizes, ColorProducts, Colors, ProductImages
+from .schemas import OrderResponse, OrderHistoryResponse, CheckoutRequest
 from .auth_routes import get_current_user
+from .checkout import place_order
+from .utils.cursor import encode_cursor, decode_cursor, InvalidCursor
 
 order_router = APIRouter(
     prefix = '/orders',
     tags = ['orders']
 )
 
-@order_router.get("/me", response_model=List[OrderResponse])
-def get_orders_by_user_id(
-    db: Session = Depends(get_db),
-    current_user: Users = Depends(get_current_user)
+# Newest orders first, one page per request. Pass the X-Next-Cursor header of a page as cursor
+# to get the next one. include=items adds the lines of every order on the page with one more query
+@order_router.get("/me", response_model=List[OrderHistoryResponse], response_model_exclude_none=True)
+async def get_orders_by_user_id(
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Users = Depends(get_current_user),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    include: Optional[Literal["items"]] = None
 ):
-    user = db.query(Users).filter(Users.id == current_user.id).first()
-    
-    if not user:
-        raise HTTPException(status_code=404, detail='User not found')
-    
-    orders = (
-        db.query(
+    query = (
+        select(
             Orders.id,
             Orders.order_status,
             Orders.order_date,
             Orders.total_amount
         )
-        .filter(Orders.user_id == user.id)
-        .all()
+        .filter(Orders.user_id == current_user.id)
+        .order_by(Orders.order_date.desc(), Orders.id.desc())
     )
-    
-    if not orders:
-        HTTPException(status_code=404, detail="User does not have any completed orders")
 
-    return orders
\ No newline at end of file
+    if cursor is not None:
+        try:
+            position = decode_cursor(cursor)
+            query = query.filter(tuple_(Orders.order_date, Orders.id) < (datetime.fromisoformat(position["order_date"]), int(position["id"])))
+        except (InvalidCursor, KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    result = await db.execute(query.limit(limit))
+    orders = [dict(order._mapping) for order in result.all()]
+
+    # A full page may have more orders after it
+    if orders and len(orders) == limit:
+        last = orders[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor({"order_date": last["order_date"].isoformat(), "id": last["id"]})
+
+    if include == "items" and orders:
+        for order in orders:
+            order["items"] = []
+        by_id = {order["id"]: order for order in orders}
+
+        result = await db.execute(
+            select(
+                OrderItems.order_id,
+                OrderItems.id,
+                OrderItems.product_variant_id,
+                ProductVariants.product_id,
+                Products.name.label("product_name"),
+                Sizes.name.label("size"),
+                Colors.name.label("color"),
+                ProductImages.image_url,
+                OrderItems.quantity,
+                OrderItems.price
+            )
+            .join(ProductVariants, OrderItems.product_variant_id == ProductVariants.id)
+            .join(Products, ProductVariants.product_id == Products.id)
+            .join(Sizes, ProductVariants.size_id == Sizes.id)
+            .join(ColorProducts, ProductVariants.color_products_id == ColorProducts.id)
+            .join(Colors, ColorProducts.color_id == Colors.id)
+            .outerjoin(ProductImages, (ProductImages.color_products_id == ColorProducts.id) & (ProductImages.position == 1))
+            .filter(OrderItems.order_id.in_(by_id.keys()))
+            .order_by(OrderItems.order_id, OrderItems.id)
+        )
+        for item in result.all():
+            by_id[item.order_id]["items"].append(item)
+
+    return orders
+
+@order_router.post("/checkout", response_model=OrderResponse, status_code=status.HTTP_201_CREATED)
+async def checkout(
+    request: CheckoutRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Users = Depends(get_current_user)
+):
+    return await place_order(db, current_user.id, request.shipping_address)
@@ -1,23 +1,41 @@
-from fastapi import Depends, APIRouter, HTTPException, status
-from typing import List
-from sqlalchemy.orm import Session
-from .database import get_db
-from .models import ProductVariants, Sizes, ColorProducts, Colors, Products, ProductImages, Categories, t_category_products
-from .schemas import ProductVariantResponse, ProductsByCategoryResponse, ProductDetailResponse, ProductImageResponse, ProductColorResponse, ProductSizeResponse
+from fastapi import Depends, APIRouter, HTTPException, Query, Response, UploadFile, status
+from typing import List, Literal, Optional
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import select, func, tuple_, union_all, values, column, BigInteger, Integer
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import get_async_db, SessionLocal
+from .models import Users, ProductVariants, Sizes, ColorProducts, Colors, Products, ProductImages, CategoryProductListings
+from .schemas import ProductVariantResponse, ProductsByCategoryResponse, ProductDetailResponse, ProductImageResponse, ProductColorResponse, ProductSizeResponse, ProductFullDetailsResponse, ResolveVariantsRequest, ResolvedVariantResponse, ProductSearchResponse, CategoryFacetsResponse
+from .catalog_version import catalog_conditional_get, catalog_version
+from .category_facets import category_facets, LISTING_SORT_KEYS
+from .product_search import to_prefix_tsquery, search_products_query
+from .utils.cursor import encode_cursor, decode_cursor, InvalidCursor
+from .utils.fast_json import list_response
+from .auth_routes import get_current_user
+from .catalog_import import import_catalog
+from starlette.concurrency import run_in_threadpool
+import io
 
 product_router = APIRouter(
     prefix = '/products',
     tags = ['products']
 )
 
-@product_router.get("/variants", response_model=List[ProductVariantResponse])
-def get_product_variants(
-    db: Session = Depends(get_db),
+# Last change of a variant, rows never updated fall back to their creation time
+variant_changed_at = func.coalesce(ProductVariants.updated_at, ProductVariants.created_at)
+
+@product_router.get("/variants", response_model=List[ProductVariantResponse], dependencies=[Depends(catalog_conditional_get)])
+async def get_product_variants(
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
     skip: int = 0,
-    limit: int = 100
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    sort: Literal["id", "updated_at"] = "id"
 ):
-    variants = (
-        db.query(
+    query = (
+        select(
             ProductVariants.id,
             ProductVariants.created_at,
             ProductVariants.reference2,
@@ -26,6 +44,7 @@ def get_product_variants(
             ProductVariants.price,
             ProductVariants.color_products_id,
             ProductVariants.updated_at,
+            variant_changed_at.label("changed_at"),
             Sizes.name.label("size_name"),
             Products.name.label("product_name"),
             Colors.name.label("color")
@@ -34,23 +53,71 @@ def get_product_variants(
         .join(ColorProducts, ProductVariants.color_products_id == ColorProducts.id)
         .join(Products, ProductVariants.product_id == Products.id)
         .join(Colors, ColorProducts.color_id == Colors.id)
-        .offset(skip)
-        .limit(limit)
-        .all()
     )
 
-    # Convert query results into dictionaries
-    return variants
+    # Keyset pagination: every page is an index range scan starting after the last row seen,
+    # so page N costs the same as page 1. sort=updated_at lets feeds resume incremental syncs
+    if sort == "updated_at":
+        query = query.order_by(variant_changed_at, ProductVariants.id)
+    else:
+        query = query.order_by(ProductVariants.id)
+
+    if cursor is not None:
+        if skip:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="skip cannot be combined with cursor")
+        try:
+            position = decode_cursor(cursor)
+            if position.get("sort") != sort:
+                raise InvalidCursor("cursor was issued for a different sort")
+            if sort == "updated_at":
+                query = query.filter(tuple_(variant_changed_at, ProductVariants.id) > (datetime.fromisoformat(position["changed_at"]), int(position["id"])))
+            else:
+                query = query.filter(ProductVariants.id > int(position["id"]))
+        except (InvalidCursor, KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    else:
+        # Offset paging is kept for existing clients
+        query = query.offset(skip)
+
+    result = await db.execute(query.limit(limit))
+    variants = result.all()
+
+    # A full page may have more rows after it
+    if variants and len(variants) == limit:
+        last = variants[-1]
+        position = {"sort": sort, "id": last.id}
+        if sort == "updated_at":
+            position["changed_at"] = last.changed_at.isoformat()
+        response.headers["X-Next-Cursor"] = encode_cursor(position)
+
+    return list_response(variants, ProductVariantResponse, response)
+
+@product_router.get("/search", response_model=List[ProductSearchResponse], dependencies=[Depends(catalog_conditional_get)])
+async def search_products(
+    q: str,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    skip: int = 0,
+    limit: int = 20
+):
+    tsquery = to_prefix_tsquery(q)
+
+    if tsquery is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Search query has no searchable terms")
+
+    result = await db.execute(search_products_query(tsquery).offset(skip).limit(limit))
+
+    return list_response(result.all(), ProductSearchResponse, response)
 
-@product_router.get("/variants/variant", response_model=ProductVariantResponse)
-def get_product_variant(
+@product_router.get("/variants/variant", response_model=ProductVariantResponse, dependencies=[Depends(catalog_conditional_get)])
+async def get_product_variant(
     product_id: int,
     size_id: int,
     color_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    variant = (
-        db.query(
+    result = await db.execute(
+        select(
             ProductVariants.id,
             ProductVariants.created_at,
             ProductVariants.reference2,
@@ -68,58 +135,171 @@ def get_product_variant(
         .join(Products, ProductVariants.product_id == Products.id)
         .join(Colors, ColorProducts.color_id == Colors.id)
         .filter(Products.id == product_id, Sizes.id == size_id, Colors.id == color_id)
-        .first()
     )
+    variant = result.first()
 
     if not variant:
         raise HTTPException(status_code=404, detail='Product variant does not exist')
 
     return variant
 
-@product_router.get("/category/{id}", response_model=list[ProductsByCategoryResponse])
-def get_products_by_category(id: int, db: Session = Depends(get_db)):
-    products = (
-        db.query(
-            ProductImages.position,
-            ProductImages.image_url,
-            ColorProducts.product_id,
-            Colors.code,
-            Colors.image_url,
-            Products.name,
-            ProductVariants.price,
-            Categories.id,
-            Categories.name
+@product_router.post("/variants/resolve", response_model=List[ResolvedVariantResponse])
+async def resolve_product_variants(
+    request: ResolveVariantsRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    by_id = [(i, item.product_variant_id) for i, item in enumerate(request.items) if item.product_variant_id is not None]
+    by_tuple = [(i, item.product_id, item.size_id, item.color_id) for i, item in enumerate(request.items) if item.product_variant_id is None]
+
+    def variant_select(wanted):
+        return (
+            select(
+                wanted.c.idx,
+                ProductVariants.id,
+                ProductVariants.created_at,
+                ProductVariants.reference2,
+                ProductVariants.stock,
+                ProductVariants.product_id,
+                ProductVariants.price,
+                ProductVariants.color_products_id,
+                ProductVariants.updated_at,
+                Sizes.name.label("size_name"),
+                Products.name.label("product_name"),
+                Colors.name.label("color")
+            )
+            .select_from(wanted)
         )
-        .distinct(ColorProducts.product_id, Categories.id, Colors.code)
-        .outerjoin(ColorProducts, ProductImages.color_products_id == ColorProducts.id)
-        .outerjoin(Colors, Colors.id == ColorProducts.color_id)
-        .outerjoin(Products, Products.id == ColorProducts.product_id)
-        .outerjoin(ProductVariants, ProductVariants.product_id == ColorProducts.product_id)
-        .outerjoin(t_category_products, t_category_products.c.product_id == ColorProducts.product_id)
-        .outerjoin(Categories, Categories.id == t_category_products.c.category_id)
-        .filter(ProductImages.position == 1, Categories.id == id)
-        .all()
-    )
 
-    return [
-        ProductsByCategoryResponse(
-            position=p[0],
-            image_url=p[1],
-            product_id=p[2],
-            color_code=p[3],
-            color_image_url=p[4],
-            product_name=p[5],
-            price=p[6],
-            category_id=p[7],
-            category_name=p[8]
+    # The lookups are joined in as VALUES lists, so the whole batch is a single statement
+    queries = []
+    if by_id:
+        wanted = values(column("idx", Integer), column("id", BigInteger), name="wanted_ids").data(by_id)
+        queries.append(
+            variant_select(wanted)
+            .join(ProductVariants, ProductVariants.id == wanted.c.id)
+            .join(Sizes, ProductVariants.size_id == Sizes.id)
+            .join(ColorProducts, ProductVariants.color_products_id == ColorProducts.id)
+            .join(Products, ProductVariants.product_id == Products.id)
+            .join(Colors, ColorProducts.color_id == Colors.id)
+        )
+    if by_tuple:
+        wanted = values(
+            column("idx", Integer),
+            column("product_id", BigInteger),
+            column("size_id", BigInteger),
+            column("color_id", BigInteger),
+            name="wanted_tuples"
+        ).data(by_tuple)
+        queries.append(
+            variant_select(wanted)
+            .join(ProductVariants, (ProductVariants.product_id == wanted.c.product_id) & (ProductVariants.size_id == wanted.c.size_id))
+            .join(ColorProducts, (ProductVariants.color_products_id == ColorProducts.id) & (ColorProducts.color_id == wanted.c.color_id))
+            .join(Sizes, ProductVariants.size_id == Sizes.id)
+            .join(Products, ProductVariants.product_id == Products.id)
+            .join(Colors, ColorProducts.color_id == Colors.id)
         )
-        for p in products
+
+    query = queries[0] if len(queries) == 1 else union_all(*queries)
+    result = await db.execute(query)
+
+    # Keep the first match per lookup, like get_product_variant does
+    variants = {}
+    for row in sorted(result.all(), key=lambda r: (r.idx, r.id)):
+        variants.setdefault(row.idx, row)
+
+    # Results follow the input order, lookups without a match are marked as not found
+    return [
+        {"found": i in variants, "variant": variants.get(i)}
+        for i in range(len(request.items))
     ]
 
-@product_router.get("/product/{id}", response_model=list[ProductDetailResponse])
-def get_product_by_id(id: int, db: Session = Depends(get_db)):
-    product = (
-        db.query(
+# Orderings of the category listing, each ends on the primary key so pages are stable
+LISTING_SORTS = {
+    "default": (CategoryProductListings.product_id, CategoryProductListings.color_id),
+    "price_asc": (CategoryProductListings.min_price.asc(), CategoryProductListings.product_id, CategoryProductListings.color_id),
+    "price_desc": (CategoryProductListings.min_price.desc(), CategoryProductListings.product_id, CategoryProductListings.color_id),
+    "newest": (CategoryProductListings.product_created_at.desc(), CategoryProductListings.product_id, CategoryProductListings.color_id),
+    "name": (CategoryProductListings.product_name, CategoryProductListings.product_id, CategoryProductListings.color_id),
+}
+
+# Filters shared by the category listing and its facets
+class ListingFilters:
+    def __init__(
+        self,
+        size_id: Optional[List[int]] = Query(None),
+        color: Optional[List[str]] = Query(None),
+        min_price: Optional[Decimal] = None,
+        max_price: Optional[Decimal] = None,
+        in_stock: bool = False
+    ):
+        self.size_ids = size_id
+        self.color_codes = color
+        self.min_price = min_price
+        self.max_price = max_price
+        self.in_stock = in_stock
+
+    def active(self):
+        return bool(self.size_ids or self.color_codes or self.min_price is not None or self.max_price is not None or self.in_stock)
+
+    def as_kwargs(self):
+        return dict(size_ids=self.size_ids, color_codes=self.color_codes, min_price=self.min_price, max_price=self.max_price, in_stock=self.in_stock)
+
+@product_router.get("/category/{id}", response_model=list[ProductsByCategoryResponse], dependencies=[Depends(catalog_conditional_get)])
+async def get_products_by_category(
+    id: int,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    filters: ListingFilters = Depends(),
+    skip: int = 0,
+    limit: Optional[int] = None,
+    sort: Literal["default", "price_asc", "price_desc", "newest", "name"] = "default"
+):
+    if filters.active():
+        # Filtered listings are answered from the category's facet index
+        index = await category_facets.get(db, id, catalog_version.etag)
+        entries = sorted(index.entries_for(index.match(**filters.as_kwargs())), key=LISTING_SORT_KEYS[sort])
+        end = skip + limit if limit is not None else None
+        return list_response(entries[skip:end], ProductsByCategoryResponse, response)
+
+    # Served from the precomputed read model maintained by listing_read_model
+    query = (
+        select(
+            CategoryProductListings.position,
+            CategoryProductListings.image_url,
+            CategoryProductListings.product_id,
+            CategoryProductListings.color_code,
+            CategoryProductListings.color_image_url,
+            CategoryProductListings.product_name,
+            CategoryProductListings.min_price.label("price"),
+            CategoryProductListings.category_id,
+            CategoryProductListings.category_name
+        )
+        .filter(CategoryProductListings.category_id == id)
+        .order_by(*LISTING_SORTS[sort])
+        .offset(skip)
+    )
+    if limit is not None:
+        query = query.limit(limit)
+
+    result = await db.execute(query)
+
+    return list_response(result.all(), ProductsByCategoryResponse, response)
+
+@product_router.get("/category/{id}/facets", response_model=CategoryFacetsResponse, dependencies=[Depends(catalog_conditional_get)])
+async def get_category_facets(
+    id: int,
+    db: AsyncSession = Depends(get_async_db),
+    filters: ListingFilters = Depends()
+):
+    # Counts come from the precomputed bitsets of the category, no GROUP BY per request
+    index = await category_facets.get(db, id, catalog_version.etag)
+
+    return index.facets(**filters.as_kwargs())
+
+@product_router.get("/product/{id}", response_model=list[ProductDetailResponse], dependencies=[Depends(catalog_conditional_get)])
+async def get_product_by_id(id: int, db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(
+        select(
             Products.id,
             Products.name,
             Products.description_details,
@@ -131,18 +311,104 @@ def get_product_by_id(id: int, db: Session = Depends(get_db)):
         )
         .join(ProductVariants, Products.id == ProductVariants.product_id)
         .filter(Products.id == id)
-        .all()
     )
+    product = result.all()
 
     if not product:
         raise(HTTPException(status_code=404, detail="Product not found"))
 
     return product
 
-@product_router.get("/product-images", response_model=list[ProductImageResponse])
-def get_product_images(color_code: str, product_id: int, db: Session = Depends(get_db)):
-    product_images = (
-        db.query(
+@product_router.get("/product/{id}/details", response_model=ProductFullDetailsResponse, dependencies=[Depends(catalog_conditional_get)])
+async def get_product_details(id: int, db: AsyncSession = Depends(get_async_db)):
+    # Everything a product page needs in four set-based queries, whatever the number of colors
+    result = await db.execute(
+        select(
+            Products.id,
+            Products.name,
+            Products.reference1,
+            Products.description_details,
+            Products.description_composition,
+            Products.description_care,
+            Products.description_delivery
+        )
+        .filter(Products.id == id)
+    )
+    product = result.first()
+
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    result = await db.execute(
+        select(
+            ColorProducts.id.label("color_products_id"),
+            ColorProducts.color_id,
+            Colors.name,
+            Colors.code,
+            Colors.image_url
+        )
+        .join(Colors, ColorProducts.color_id == Colors.id)
+        .filter(ColorProducts.product_id == id)
+        .order_by(ColorProducts.id)
+    )
+    colors = {
+        c.color_products_id: {
+            "color_id": c.color_id,
+            "name": c.name,
+            "code": c.code,
+            "image_url": c.image_url,
+            "images": [],
+            "sizes": []
+        }
+        for c in result.all()
+    }
+
+    if colors:
+        result = await db.execute(
+            select(
+                ProductImages.color_products_id,
+                ProductImages.id,
+                ProductImages.image_url,
+                ProductImages.position
+            )
+            .filter(ProductImages.color_products_id.in_(colors.keys()))
+            .order_by(ProductImages.color_products_id, ProductImages.position.asc())
+        )
+        for image in result.all():
+            colors[image.color_products_id]["images"].append(
+                {"id": image.id, "image_url": image.image_url, "position": image.position}
+            )
+
+        result = await db.execute(
+            select(
+                ProductVariants.color_products_id,
+                ProductVariants.id,
+                ProductVariants.size_id,
+                Sizes.name,
+                ProductVariants.stock,
+                ProductVariants.price
+            )
+            .join(Sizes, Sizes.id == ProductVariants.size_id)
+            .filter(ProductVariants.color_products_id.in_(colors.keys()))
+            .order_by(ProductVariants.color_products_id, ProductVariants.size_id.asc())
+        )
+        for variant in result.all():
+            colors[variant.color_products_id]["sizes"].append(
+                {
+                    "product_variant_id": variant.id,
+                    "size_id": variant.size_id,
+                    "name": variant.name,
+                    "stock": variant.stock,
+                    "price": variant.price
+                }
+            )
+
+    return {**product._mapping, "colors": list(colors.values())}
+
+@product_router.get("/product-images", response_model=list[ProductImageResponse], dependencies=[Depends(catalog_conditional_get)])
+async def get_product_images(color_code: str, product_id: int, db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(
+        select(
             ProductImages.id,
             ProductImages.image_url,
             ProductImages.position,
@@ -152,18 +418,18 @@ def get_product_images(color_code: str, product_id: int, db: Session = Depends(g
         .join(Colors, ColorProducts.color_id == Colors.id)
         .filter(Colors.code == color_code, ColorProducts.product_id == product_id)
         .order_by(ProductImages.position.asc())
-        .all()
     )
+    product_images = result.all()
 
     if not product_images:
         raise HTTPException(status_code=404, detail="No product images found")
     
     return product_images
 
-@product_router.get("/product-colors", response_model=list[ProductColorResponse])
-def get_product_colors(product_id: int, db: Session = Depends(get_db)):
-    product_colors = (
-        db.query(
+@product_router.get("/product-colors", response_model=list[ProductColorResponse], dependencies=[Depends(catalog_conditional_get)])
+async def get_product_colors(product_id: int, db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(
+        select(
             Colors.name,
             Colors.code,
             Colors.image_url,
@@ -171,18 +437,18 @@ def get_product_colors(product_id: int, db: Session = Depends(get_db)):
         )
         .join(ColorProducts, ColorProducts.color_id == Colors.id)
         .filter(ColorProducts.product_id == product_id)
-        .all()
     )
+    product_colors = result.all()
 
     if not product_colors:
         raise HTTPException(status_code=404, detail="No product colors found")
     
     return product_colors
 
-@product_router.get("/product-sizes", response_model=list[ProductSizeResponse])
-def get_product_sizes(color_code: str, product_id: int, db: Session = Depends(get_db)):
-    product_sizes = (
-        db.query(
+@product_router.get("/product-sizes", response_model=list[ProductSizeResponse], dependencies=[Depends(catalog_conditional_get)])
+async def get_product_sizes(color_code: str, product_id: int, db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(
+        select(
             ProductVariants.size_id,
             Sizes.name,
             ProductVariants.stock
@@ -192,10 +458,31 @@ def get_product_sizes(color_code: str, product_id: int, db: Session = Depends(ge
         .join(Colors, ColorProducts.color_id == Colors.id)
         .filter(Colors.code == color_code, ColorProducts.product_id == product_id)
         .order_by(ProductVariants.size_id.asc())
-        .all()
     )
+    product_sizes = result.all()
 
     if not product_sizes:
         raise HTTPException(status_code=404, detail="No product sizes found")
     
-    return product_sizes
\ No newline at end of file
+    return product_sizes
+
+def run_catalog_import(file, format: str):
+    with SessionLocal() as db:
+        return import_catalog(db, io.TextIOWrapper(file, encoding="utf-8", newline=""), format).as_dict()
+
+# Bulk load of products and variants from a CSV or JSONL file, see catalog_import.
+# Runs on the blocking psycopg2 session since it streams the rows in with COPY
+@product_router.post("/import")
+async def import_products(
+    file: UploadFile,
+    format: Optional[Literal["csv", "jsonl"]] = None,
+    current_user: Users = Depends(get_current_user)
+):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access not allowed")
+
+    format = format or ("csv" if (file.filename or "").endswith(".csv") else "jsonl")
+    report = await run_in_threadpool(run_catalog_import, file.file, format)
+    catalog_version.invalidate()
+
+    return report
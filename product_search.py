@@ -0,0 +1,25 @@
+from sqlalchemy import select, func, literal_column
+from .models import Products
+import re
+
+# Words taken from a search query, longer queries are cut to keep the tsquery small
+MAX_SEARCH_TERMS = 8
+
+# Turns free text into a prefix tsquery: "oxford shi" -> "oxford:* & shi:*".
+# Only word characters are kept, so user input can never inject tsquery operators
+def to_prefix_tsquery(q: str):
+    terms = re.findall(r"\w+", q.lower())[:MAX_SEARCH_TERMS]
+    if not terms:
+        return None
+    return " & ".join(f"{term}:*" for term in terms)
+
+# Matches answered by the GIN index on products.search_vector, ranked with the name and
+# reference1 weighted above the descriptions
+def search_products_query(tsquery: str):
+    query = func.to_tsquery(literal_column("'simple'"), tsquery)
+    rank = func.ts_rank(Products.search_vector, query).label("rank")
+    return (
+        select(Products.id, Products.name, Products.reference1, rank)
+        .filter(Products.search_vector.op("@@")(query))
+        .order_by(rank.desc(), Products.id)
+    )
@@ -0,0 +1,94 @@
+from contextvars import ContextVar
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+import os
+import re
+import time
+
+# Count the SQL statements and database time of every request and report them in a
+# Server-Timing header, e.g. Server-Timing: db;dur=4.31;desc="3 queries", app;dur=9.87
+QUERY_STATS = os.getenv("QUERY_STATS", "true").lower() in ("1", "true", "yes")
+
+class QueryStats:
+    __slots__ = ("count", "duration")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def record(self, seconds):
+        self.count += 1
+        self.duration += seconds
+
+    def server_timing(self, total):
+        return f'db;dur={self.duration * 1000:.2f};desc="{self.count} queries", app;dur={total * 1000:.2f}'
+
+# Stats of the request being handled. The threadpool copies the context, so statements run
+# by ThreadedSession and sync endpoints land on the same object
+_current_stats = ContextVar("query_stats", default=None)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_stats.get() is not None:
+        context._query_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.record(time.perf_counter() - context._query_started)
+
+# Failed statements took a round trip too
+def _handle_error(exception_context):
+    stats = _current_stats.get()
+    started = getattr(exception_context.execution_context, "_query_started", None)
+    if stats is not None and started is not None:
+        stats.record(time.perf_counter() - started)
+
+# Registers the counters on an Engine, or on the sync_engine behind an AsyncEngine
+def instrument_engine(engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+# Plain ASGI middleware so the handler runs in the task that set the context. The header is
+# written when the response starts, statements run while a StreamingResponse is sent are
+# not in it
+class ServerTimingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not QUERY_STATS:
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _current_stats.set(stats)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("Server-Timing", stats.server_timing(time.perf_counter() - started))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_stats.reset(token)
+
+_QUERY_COUNT = re.compile(r'(?:^|,)\s*db;[^,]*desc="(\d+) queries"')
+
+# Number of statements a response's request ran, read back from its Server-Timing header
+def query_count(response):
+    match = _QUERY_COUNT.search(response.headers.get("server-timing", ""))
+    if match is None:
+        raise AssertionError(f"{response.request.method} {response.request.url.path} has no db Server-Timing entry, is QUERY_STATS on?")
+    return int(match.group(1))
+
+# Fails when a request ran more statements than the route's budget, so new N+1s and extra
+# round trips show up in CI instead of in production. Works with any client whose responses
+# carry headers and the request, e.g. TestClient or httpx
+def assert_max_queries(response, limit):
+    count = query_count(response)
+    if count > limit:
+        raise AssertionError(f"{response.request.method} {response.request.url.path} ran {count} queries, the budget is {limit}")
+    return count
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, model_validator
 import datetime
-from typing import Optional
+from typing import List, Optional
 
 class UserResponse(BaseModel):
     id: int
@@ -29,6 +29,28 @@ class ProductVariantResponse(BaseModel):
     created_at: datetime.datetime
     updated_at: Optional[datetime.datetime]
 
+class VariantLookupRequest(BaseModel):
+    product_variant_id: Optional[int] = None
+    product_id: Optional[int] = None
+    size_id: Optional[int] = None
+    color_id: Optional[int] = None
+
+    @model_validator(mode='after')
+    def check_lookup(self):
+        by_tuple = (self.product_id, self.size_id, self.color_id)
+        if self.product_variant_id is None and None in by_tuple:
+            raise ValueError('Either product_variant_id or product_id, size_id and color_id are required')
+        if self.product_variant_id is not None and by_tuple != (None, None, None):
+            raise ValueError('product_variant_id cannot be combined with product_id, size_id and color_id')
+        return self
+
+class ResolveVariantsRequest(BaseModel):
+    items: List[VariantLookupRequest] = Field(..., min_length=1, max_length=1000)
+
+class ResolvedVariantResponse(BaseModel):
+    found: bool
+    variant: Optional[ProductVariantResponse]
+
 class ProductsByCategoryResponse(BaseModel):
     position: int
     image_url: str
@@ -40,6 +62,28 @@ class ProductsByCategoryResponse(BaseModel):
     category_id: int
     category_name: str
 
+class SizeFacetResponse(BaseModel):
+    size_id: int
+    name: str
+    count: int
+
+class ColorFacetResponse(BaseModel):
+    code: str
+    name: str
+    count: int
+
+class PriceBandFacetResponse(BaseModel):
+    min_price: Optional[float]
+    max_price: Optional[float]
+    count: int
+
+class CategoryFacetsResponse(BaseModel):
+    total: int
+    sizes: List[SizeFacetResponse]
+    colors: List[ColorFacetResponse]
+    price_bands: List[PriceBandFacetResponse]
+    in_stock: int
+
 class CategoryResponse(BaseModel):
     id: int
     name: str
@@ -54,6 +98,12 @@ class ProductDetailResponse(BaseModel):
     product_variant_id: int
     price: float
 
+class ProductSearchResponse(BaseModel):
+    id: int
+    name: str
+    reference1: str
+    rank: float
+
 class ProductImageResponse(BaseModel):
     id: int
     image_url: str
@@ -71,6 +121,36 @@ class ProductSizeResponse(BaseModel):
     name:str
     stock: int
 
+class ProductColorImageResponse(BaseModel):
+    id: int
+    image_url: str
+    position: Optional[int]
+
+class ProductColorSizeResponse(BaseModel):
+    product_variant_id: int
+    size_id: int
+    name: str
+    stock: int
+    price: float
+
+class ProductColorDetailsResponse(BaseModel):
+    color_id: int
+    name: str
+    code: str
+    image_url: str
+    images: List[ProductColorImageResponse]
+    sizes: List[ProductColorSizeResponse]
+
+class ProductFullDetailsResponse(BaseModel):
+    id: int
+    name: str
+    reference1: str
+    description_details: Optional[str]
+    description_composition: Optional[str]
+    description_care: Optional[str]
+    description_delivery: Optional[str]
+    colors: List[ProductColorDetailsResponse]
+
 class UpdateUserRequest(BaseModel):
     title: Optional[str]
     first_name: Optional[str]
@@ -89,6 +169,23 @@ class OrderResponse(BaseModel):
     order_date: datetime.datetime
     total_amount: float
 
+class OrderItemDetailsResponse(BaseModel):
+    id: int
+    product_variant_id: int
+    product_id: int
+    product_name: str
+    size: str
+    color: str
+    image_url: Optional[str]
+    quantity: int
+    price: float
+
+class OrderHistoryResponse(OrderResponse):
+    items: Optional[List[OrderItemDetailsResponse]] = None
+
+class CheckoutRequest(BaseModel):
+    shipping_address: str = Field(..., min_length=1, max_length=255)
+
 class CartResponse(BaseModel):
     id: int
     user_id: int
@@ -96,6 +193,8 @@ class CartResponse(BaseModel):
     session_id: Optional[str]
     created_at: datetime.datetime
     updated_at: Optional[datetime.datetime]
+    item_count: int
+    subtotal: float
 
 class CartItemsResponse(BaseModel):
     id: int
@@ -119,4 +218,11 @@ class ItemsInCartResponse(BaseModel):
 class AddItemToCartRequest(BaseModel):
     product_variant_id: int
     quantity: int
-    price: float
\ No newline at end of file
+    price: float
+
+class BatchCartItemRequest(BaseModel):
+    product_variant_id: int
+    quantity: int = Field(..., gt=0)
+
+class AddItemsToCartRequest(BaseModel):
+    items: List[BatchCartItemRequest] = Field(..., min_length=1, max_length=100)
\ No newline at end of file
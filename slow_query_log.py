@@ -0,0 +1,224 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar, Context
+from datetime import datetime, timezone
+from threading import Lock
+from sqlalchemy import event
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# Opt-in recorder of statements slower than SLOW_QUERY_THRESHOLD_MS, kept in memory for
+# GET /slow-queries
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", "false").lower() in ("1", "true", "yes")
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+# Most recent slow statements kept, older ones are dropped
+SLOW_QUERY_BUFFER_SIZE = int(os.getenv("SLOW_QUERY_BUFFER_SIZE", "200"))
+# Share of slow SELECTs run again under EXPLAIN (ANALYZE, BUFFERS) to capture their plan
+SLOW_QUERY_EXPLAIN_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_RATE", "0.1"))
+SLOW_QUERY_EXPLAIN_TIMEOUT_MS = int(os.getenv("SLOW_QUERY_EXPLAIN_TIMEOUT_MS", "10000"))
+# Parameters whose bind name matches are recorded as [REDACTED]
+SLOW_QUERY_REDACT = re.compile(os.getenv("SLOW_QUERY_REDACT", "password|token|secret|email|hash"), re.IGNORECASE)
+
+REDACTED = "[REDACTED]"
+MAX_STATEMENT_LENGTH = 10_000
+MAX_PARAMETER_LENGTH = 200
+
+# Only reads are explained. EXPLAIN ANALYZE runs the statement a second time, so reads that
+# lock rows and CTEs that write get a plain EXPLAIN, a plan without timings
+_EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+_LOCKING = re.compile(r"\bFOR\s+(UPDATE|SHARE|NO\s+KEY\s+UPDATE|KEY\s+SHARE)\b", re.IGNORECASE)
+_CTE = re.compile(r"^\s*WITH\b", re.IGNORECASE)
+_WRITES = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE)\b", re.IGNORECASE)
+
+EXPLAIN_ANALYZE = "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) "
+EXPLAIN_PLAN = "EXPLAIN (FORMAT JSON) "
+
+def _explain_prefix(statement):
+    if _LOCKING.search(statement) or (_CTE.match(statement) and _WRITES.search(statement)):
+        return EXPLAIN_PLAN
+    return EXPLAIN_ANALYZE
+
+# Scope of the request being handled, set by SlowQueryMiddleware
+_current_scope = ContextVar("slow_query_scope", default=None)
+
+def _route(scope):
+    if scope is None:
+        return None
+    route = scope.get("route")
+    return f"{scope['method']} {route.path_format if route is not None else scope['path']}"
+
+def _redact_value(name, value):
+    if name is not None and SLOW_QUERY_REDACT.search(name):
+        return REDACTED
+    if isinstance(value, (bytes, bytearray)):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, str) and len(value) > MAX_PARAMETER_LENGTH:
+        return value[:MAX_PARAMETER_LENGTH] + "..."
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+# Bound parameters by bind name when the statement was compiled by SQLAlchemy. Raw driver
+# SQL has no names, so only its non-string values are kept
+def _redact_parameters(context, parameters):
+    if context.compiled is not None and context.compiled_parameters:
+        return {name: _redact_value(name, value) for name, value in context.compiled_parameters[0].items()}
+    if isinstance(parameters, dict):
+        return {name: _redact_value(name, value) for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [REDACTED if isinstance(value, str) else _redact_value(None, value) for value in parameters]
+    return None
+
+def _plan_from(value):
+    # psycopg2 decodes the json column, asyncpg hands back text
+    return json.loads(value) if isinstance(value, str) else value
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms=SLOW_QUERY_THRESHOLD_MS, size=SLOW_QUERY_BUFFER_SIZE, explain_rate=SLOW_QUERY_EXPLAIN_RATE):
+        self.threshold = threshold_ms / 1000
+        self.explain_rate = explain_rate
+        # deque appends are atomic, the lock only guards the counters and the EXPLAIN slot
+        self.entries = deque(maxlen=size)
+        self.recorded = 0
+        self.explained = 0
+        self._lock = Lock()
+        # Only one EXPLAIN at a time, further samples are skipped while it runs
+        self._explaining = False
+        self._executor = None
+        # sync Engine -> the Engine or AsyncEngine the EXPLAINs run on
+        self._explain_engines = {}
+
+    # Registers the recorder on an Engine or AsyncEngine
+    def instrument(self, engine):
+        sync_engine = getattr(engine, "sync_engine", engine)
+        self._explain_engines[sync_engine] = engine
+        event.listen(sync_engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._slow_query_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._slow_query_started
+        if elapsed < self.threshold or not context.execution_options.get("slow_query_log", True):
+            return
+
+        entry = {
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+            "duration_ms": round(elapsed * 1000, 2),
+            "route": _route(_current_scope.get()),
+            "statement": statement[:MAX_STATEMENT_LENGTH],
+            "parameters": _redact_parameters(context, parameters),
+            "executemany": len(parameters) if executemany else None,
+            "plan": None,
+            "explain_error": None,
+        }
+        self.entries.append(entry)
+        with self._lock:
+            self.recorded += 1
+
+        if not executemany and _EXPLAINABLE.match(statement) and random.random() < self.explain_rate:
+            self._start_explain(conn.engine, _explain_prefix(statement) + statement, parameters, entry)
+
+    # The EXPLAIN runs on its own pooled connection, outside the request's transaction and
+    # after the request has moved on, and is always rolled back
+    def _start_explain(self, sync_engine, statement, parameters, entry):
+        with self._lock:
+            if self._explaining:
+                return
+            self._explaining = True
+
+        engine = self._explain_engines.get(sync_engine, sync_engine)
+        try:
+            if engine is sync_engine:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query-explain")
+                self._executor.submit(self._explain, engine, statement, parameters, entry)
+            else:
+                # Async engines only run statements on the event loop thread. An empty context
+                # keeps the EXPLAIN out of the request's query stats
+                asyncio.get_running_loop().create_task(
+                    self._explain_async(engine, statement, parameters, entry), context=Context()
+                )
+        except Exception:
+            self._explaining = False
+            raise
+
+    def _explain(self, engine, statement, parameters, entry):
+        try:
+            with engine.connect().execution_options(slow_query_log=False) as conn:
+                conn.exec_driver_sql(f"SET LOCAL statement_timeout = {SLOW_QUERY_EXPLAIN_TIMEOUT_MS}")
+                conn.exec_driver_sql(f"SET LOCAL lock_timeout = {SLOW_QUERY_EXPLAIN_TIMEOUT_MS}")
+                entry["plan"] = _plan_from(conn.exec_driver_sql(statement, parameters).scalar())
+            with self._lock:
+                self.explained += 1
+        except Exception as exc:
+            entry["explain_error"] = str(exc).splitlines()[0]
+            logger.warning("EXPLAIN of a slow query failed: %s", entry["explain_error"])
+        finally:
+            self._explaining = False
+
+    async def _explain_async(self, engine, statement, parameters, entry):
+        try:
+            async with engine.connect() as conn:
+                conn = await conn.execution_options(slow_query_log=False)
+                await conn.exec_driver_sql(f"SET LOCAL statement_timeout = {SLOW_QUERY_EXPLAIN_TIMEOUT_MS}")
+                await conn.exec_driver_sql(f"SET LOCAL lock_timeout = {SLOW_QUERY_EXPLAIN_TIMEOUT_MS}")
+                result = await conn.exec_driver_sql(statement, parameters)
+                entry["plan"] = _plan_from(result.scalar())
+            with self._lock:
+                self.explained += 1
+        except Exception as exc:
+            entry["explain_error"] = str(exc).splitlines()[0]
+            logger.warning("EXPLAIN of a slow query failed: %s", entry["explain_error"])
+        finally:
+            self._explaining = False
+
+    # Newest first
+    def snapshot(self):
+        return {
+            "enabled": SLOW_QUERY_LOG,
+            "threshold_ms": self.threshold * 1000,
+            "explain_rate": self.explain_rate,
+            "recorded": self.recorded,
+            "explained": self.explained,
+            "entries": list(reversed(self.entries)),
+        }
+
+    def clear(self):
+        self.entries.clear()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+slow_query_log = SlowQueryLog()
+
+# Makes the request's route available to statements recorded while it is handled
+class SlowQueryMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not SLOW_QUERY_LOG:
+            await self.app(scope, receive, send)
+            return
+
+        token = _current_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_scope.reset(token)
+
+# Registers the recorder on an engine when SLOW_QUERY_LOG is on, at no cost otherwise
+def instrument_engine(engine):
+    if SLOW_QUERY_LOG:
+        slow_query_log.instrument(engine)
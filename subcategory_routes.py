@@ -1,9 +1,10 @@
-from fastapi import Depends, APIRouter, HTTPException, status
+from fastapi import Depends, APIRouter, HTTPException, Request, Response, status
 from typing import List
-from sqlalchemy.orm import Session
-from .database import get_db
-from .models import Categories
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import get_async_db
 from .schemas import CategoryResponse
+from .category_cache import category_tree
+from .utils.conditional import check_not_modified
 
 subcategory_router = APIRouter(
     prefix = '/subcategories',
@@ -11,27 +12,22 @@ subcategory_router = APIRouter(
 )
 
 @subcategory_router.get("/", response_model=List[CategoryResponse])
-def get_subcategories(db: Session = Depends(get_db)):
-    subcategories = (
-        db.query(Categories)
-        .where(Categories.parent_id != 0)
-        .all()
-    )
+async def get_subcategories(request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+    await category_tree.ensure_fresh(db)
+    check_not_modified(request, response, category_tree.etag, category_tree.last_modified)
 
-    return subcategories
+    return category_tree.subcategories
 
 @subcategory_router.get("/{parent_id}", response_model=List[CategoryResponse])
-def get_subcategories_by_parent_id(parent_id: int, db: Session = Depends(get_db)):
+async def get_subcategories_by_parent_id(parent_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
 
     if parent_id == 0:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Subcategory not found")
-    subcategories = (
-        db.query(Categories)
-        .filter(Categories.parent_id == parent_id)
-        .all()
-    )
+    await category_tree.ensure_fresh(db)
+    subcategories = category_tree.children(parent_id)
 
     if not subcategories:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Subcategory not found")
 
+    check_not_modified(request, response, category_tree.etag, category_tree.last_modified)
     return subcategories
\ No newline at end of file
@@ -0,0 +1,15 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from ..catalog_version import catalog_changed_at_query
+
+
+def test_delete_moves_catalog_version(seeded_db):
+    with Session(seeded_db) as db:
+        before = db.scalar(catalog_changed_at_query())
+
+        # Deletes leave no timestamp, the version must still move so ETags and facet indexes are not reused
+        db.execute(text("DELETE FROM product_images WHERE id = (SELECT max(id) FROM product_images)"))
+        db.commit()
+
+        assert db.scalar(catalog_changed_at_query()) > before
@@ -0,0 +1,80 @@
+# Deletes leave no timestamp behind, the delta refresh must still pick them up through the
+# listing change log. The highest product ids are used, the query budget tests read the lowest.
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .. import listing_read_model
+from ..listing_read_model import ListingRefresher
+
+
+@pytest.fixture
+def db(seeded_db):
+    with Session(seeded_db) as db:
+        yield db
+
+
+# Seeding logged every category membership just now, without an overlap the refresher only
+# sees what the tests change
+@pytest.fixture
+def refresher(db, monkeypatch):
+    monkeypatch.setattr(listing_read_model, "LISTING_REFRESH_OVERLAP", 0)
+    refresher = ListingRefresher()
+    refresher.run_once(db)
+    return refresher
+
+
+# Listed product colors, newest first
+LISTED = (
+    "SELECT cp.id FROM color_products cp "
+    "WHERE EXISTS (SELECT 1 FROM category_product_listings l WHERE l.product_id = cp.product_id AND l.color_id = cp.color_id)"
+)
+
+
+def listing_row(db, color_products_id):
+    return db.execute(text(
+        "SELECT l.min_price, l.image_url FROM category_product_listings l "
+        "JOIN color_products cp ON cp.product_id = l.product_id AND cp.color_id = l.color_id "
+        "WHERE cp.id = :id LIMIT 1"
+    ), {"id": color_products_id}).first()
+
+
+def test_variant_delete_refreshes_min_price(db, refresher):
+    color_products_id = db.scalar(text(LISTED + " ORDER BY cp.id DESC LIMIT 1"))
+    price = listing_row(db, color_products_id).min_price
+
+    # One cheaper variant, picked up through its timestamp
+    variant_id = db.scalar(text("SELECT min(id) FROM product_variants WHERE color_products_id = :id"), {"id": color_products_id})
+    db.execute(text("UPDATE product_variants SET price = price - 1, updated_at = now() WHERE id = :id"), {"id": variant_id})
+    db.commit()
+    refresher.run_once(db)
+    assert listing_row(db, color_products_id).min_price == price - 1
+
+    db.execute(text("DELETE FROM product_variants WHERE id = :id"), {"id": variant_id})
+    db.commit()
+    refresher.run_once(db)
+    assert listing_row(db, color_products_id).min_price == price
+
+
+def test_image_delete_refreshes_primary_image(db, refresher):
+    color_products_id = db.scalar(text(LISTED + " ORDER BY cp.id DESC OFFSET 1 LIMIT 1"))
+    old_image = listing_row(db, color_products_id).image_url
+
+    # The next image becomes the primary one
+    db.execute(text("DELETE FROM product_images WHERE color_products_id = :id AND position = 1"), {"id": color_products_id})
+    db.execute(text("UPDATE product_images SET position = position - 1 WHERE color_products_id = :id"), {"id": color_products_id})
+    db.commit()
+    refresher.run_once(db)
+
+    assert listing_row(db, color_products_id).image_url != old_image
+
+
+def test_color_delete_removes_listing_rows(db, refresher):
+    color_products_id = db.scalar(text(LISTED + " ORDER BY cp.id DESC OFFSET 2 LIMIT 1"))
+
+    # Removing every image of a color takes it off the listings
+    db.execute(text("DELETE FROM product_images WHERE color_products_id = :id"), {"id": color_products_id})
+    db.commit()
+    refresher.run_once(db)
+
+    assert listing_row(db, color_products_id) is None
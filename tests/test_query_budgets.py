@@ -0,0 +1,100 @@
+# Statements each hot route may run per request, read from the Server-Timing header. Caches
+# (principals, catalog version, category tree, facet indexes) are warmed by a first request,
+# so the budgets are the steady state. Raise a budget only together with the change that
+# needs the extra round trip.
+import pytest
+from sqlalchemy import text
+
+from ..query_stats import assert_max_queries
+
+QUERY_BUDGETS = {
+    "listing": 1,
+    "listing_sorted": 1,
+    "listing_filtered": 0,
+    "listing_facets": 0,
+    "product": 1,
+    "product_details": 4,
+    "cart_add_item": 3,
+    "cart_add_items": 3,
+    "cart_items": 2,
+    "checkout": 7,
+    "order_history": 1,
+    "order_history_items": 2,
+}
+
+
+@pytest.fixture(scope="module")
+def catalog(seeded_db):
+    with seeded_db.connect() as conn:
+        return {
+            "category_id": conn.scalar(text("SELECT category_id FROM category_product_listings ORDER BY category_id LIMIT 1")),
+            "product_id": conn.scalar(text("SELECT min(id) FROM products")),
+            "variant_ids": conn.execute(text("SELECT id FROM product_variants WHERE stock > 10 ORDER BY id LIMIT 5")).scalars().all(),
+        }
+
+
+def request_within_budget(client, budget, method, url, **kwargs):
+    # The first request fills the caches the route reads through
+    client.request(method, url, **kwargs)
+    response = client.request(method, url, **kwargs)
+    assert response.status_code < 400, response.text
+    assert_max_queries(response, QUERY_BUDGETS[budget])
+    return response
+
+
+@pytest.mark.parametrize("budget, params", [
+    ("listing", {"limit": 48}),
+    ("listing_sorted", {"limit": 48, "sort": "price_asc"}),
+    ("listing_filtered", {"limit": 48, "size_id": [2, 3], "in_stock": "true"}),
+])
+def test_category_listing(client, catalog, budget, params):
+    response = request_within_budget(client, budget, "GET", f"/products/category/{catalog['category_id']}", params=params)
+    assert response.json()
+
+
+def test_category_facets(client, catalog):
+    request_within_budget(client, "listing_facets", "GET", f"/products/category/{catalog['category_id']}/facets")
+
+
+def test_product(client, catalog):
+    request_within_budget(client, "product", "GET", f"/products/product/{catalog['product_id']}")
+
+
+def test_product_details(client, catalog):
+    request_within_budget(client, "product_details", "GET", f"/products/product/{catalog['product_id']}/details")
+
+
+def test_cart_add_item(client, catalog, login):
+    headers = login(2)
+    item = {"product_variant_id": catalog["variant_ids"][0], "quantity": 1, "price": 10}
+    request_within_budget(client, "cart_add_item", "POST", "/carts/cart/add-cart-item", json=item, headers=headers)
+
+
+def test_cart_add_items(client, catalog, login):
+    headers = login(2)
+    items = {"items": [{"product_variant_id": variant_id, "quantity": 1} for variant_id in catalog["variant_ids"]]}
+    request_within_budget(client, "cart_add_items", "POST", "/carts/cart/add-cart-items", json=items, headers=headers)
+
+
+def test_cart_items(client, catalog, login):
+    headers = login(2)
+    cart = client.get("/carts/cart", headers=headers).json()
+    request_within_budget(client, "cart_items", "GET", f"/carts/cart/{cart['id']}/cart-items", headers=headers)
+
+
+def test_checkout(client, catalog, login):
+    headers = login(3)
+    items = {"items": [{"product_variant_id": variant_id, "quantity": 1} for variant_id in catalog["variant_ids"]]}
+    assert client.post("/carts/cart/add-cart-items", json=items, headers=headers).status_code == 200
+
+    response = client.post("/orders/checkout", json={"shipping_address": "1 Savile Row, London"}, headers=headers)
+    assert response.status_code == 201, response.text
+    assert_max_queries(response, QUERY_BUDGETS["checkout"])
+
+
+@pytest.mark.parametrize("budget, params", [
+    ("order_history", {}),
+    ("order_history_items", {"include": "items"}),
+])
+def test_order_history(client, login, budget, params):
+    request_within_budget(client, budget, "GET", "/orders/me", params=params, headers=login(3))
@@ -0,0 +1,69 @@
+from sqlalchemy import select
+from .database import DB_ASYNC, SessionLocal, AsyncSessionLocal
+from .models import Users
+import csv
+import io
+import json
+
+# Rows fetched from the server-side cursor and written out per chunk
+EXPORT_BATCH_SIZE = 1000
+
+# Same fields as UserResponse, without the remember token
+USER_EXPORT_COLUMNS = [
+    Users.id,
+    Users.title,
+    Users.first_name,
+    Users.last_name,
+    Users.gender,
+    Users.email,
+    Users.is_admin,
+    Users.created_at,
+    Users.email_verified_at,
+    Users.updated_at,
+]
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+def users_export_query():
+    return select(*USER_EXPORT_COLUMNS).order_by(Users.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+def _csv_header():
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow([column.key for column in USER_EXPORT_COLUMNS])
+    return buffer.getvalue()
+
+def _chunk(rows, format: str):
+    buffer = io.StringIO()
+    if format == "csv":
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(["" if value is None else value.isoformat() if hasattr(value, "isoformat") else value for value in row])
+    else:
+        for row in rows:
+            buffer.write(json.dumps(dict(row._mapping), default=lambda value: value.isoformat()))
+            buffer.write("\n")
+    return buffer.getvalue()
+
+# Streams the users table through a server-side cursor one batch at a time, so memory stays
+# flat however large the table is. The generators own their session: it lives as long as
+# the response body is being written, not as long as the request handler
+def export_users(format: str):
+    if DB_ASYNC:
+        return _export_users_async(format)
+    return _export_users_sync(format)
+
+def _export_users_sync(format: str):
+    if format == "csv":
+        yield _csv_header()
+    with SessionLocal() as db:
+        result = db.execute(users_export_query())
+        for rows in result.partitions():
+            yield _chunk(rows, format)
+
+async def _export_users_async(format: str):
+    if format == "csv":
+        yield _csv_header()
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(users_export_query())
+        async for rows in result.partitions():
+            yield _chunk(rows, format)
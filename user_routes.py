@@ -1,11 +1,13 @@
 from fastapi import Depends, APIRouter, HTTPException, status
 from typing import List
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from passlib.hash import bcrypt
-from .database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import get_db, get_async_db
 from .models import Users
 from .schemas import UpdateUserRequest, UpdateUserPasswordRequest
-from .auth_routes import get_current_user
+from .auth_routes import get_current_user, principal_cache
+from .utils.password_hash import password_hasher
 
 user_router = APIRouter(
     prefix = '/users',
@@ -28,21 +30,26 @@ def update_user(
     
     db.commit()
     db.refresh(user)
+
+    # Drop the cached principal under both the old and the new email
+    principal_cache.invalidate(current_user.email, user.email)
+
     return user
 
 @user_router.put("/me/password")
-def update_user_password(
+async def update_user_password(
     data: UpdateUserPasswordRequest, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: Users = Depends(get_current_user)
 ):
-    user = db.query(Users).filter(Users.id == current_user.id).first()
+    result = await db.execute(select(Users).filter(Users.id == current_user.id))
+    user = result.scalars().first()
 
     if not user:
         raise HTTPException(status_code=404, detail='User not found')
 
     # Verify current password
-    if not bcrypt.verify(data.current_password, user.password_hash):
+    if not await password_hasher.verify(data.current_password, user.password_hash):
         raise HTTPException(status_code=400, detail='Incorrect current password')
     
     # Verify new password
@@ -50,8 +57,10 @@ def update_user_password(
         raise HTTPException(status_code=400, detail='New password does not match with the confirmation')
     
     # Hash the new password
-    user.password_hash = bcrypt.hash(data.new_password)
+    user.password_hash = await password_hasher.hash(data.new_password)
 
-    db.commit()
+    await db.commit()
+
+    principal_cache.invalidate(user.email)
 
     return {'message': 'Password updated successfully'}
\ No newline at end of file
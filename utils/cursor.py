@@ -0,0 +1,20 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+import json
+
+class InvalidCursor(ValueError):
+    pass
+
+# Opaque keyset cursors, the payload is the sort key of the last row of a page
+def encode_cursor(payload: dict) -> str:
+    raw = json.dumps(payload, separators=(",", ":"), default=str).encode()
+    return urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        raw = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+    except ValueError as e:
+        raise InvalidCursor(str(e)) from e
+    if not isinstance(payload, dict):
+        raise InvalidCursor("cursor payload must be an object")
+    return payload
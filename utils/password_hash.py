@@ -1,9 +1,95 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from passlib.context import CryptContext
+from typing import Optional, Tuple
+import asyncio
+import os
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Cost for new hashes, stored hashes below it are upgraded on the next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS
+)
+
+# "thread" or "process", a process pool lets bcrypt use every core
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+# Hash operations allowed to run or wait at once before new ones are rejected
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(PASSWORD_HASH_WORKERS * 4)))
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+    return pwd_context.verify(plain_password, hashed_password)
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+class PasswordHashingBusy(Exception):
+    pass
+
+# Runs bcrypt off the event loop in a dedicated, size-limited executor
+class PasswordHasher:
+    def __init__(self, workers: int, max_pending: int, use_processes: bool = False):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.use_processes = use_processes
+        self._executor = None
+        # Only touched from the event loop thread
+        self.pending = 0
+        self.rejected = 0
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.use_processes:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    async def _run(self, fn, *args):
+        # Fail fast instead of queueing behind a login spike
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordHashingBusy()
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    # Returns (valid, new_hash), new_hash is set when the stored hash should be replaced
+    async def verify_and_update(self, plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        return await self._run(verify_and_update_password, plain_password, hashed_password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self):
+        return {
+            "executor": "process" if self.use_processes else "thread",
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "rejected": self.rejected,
+        }
+
+password_hasher = PasswordHasher(
+    workers=PASSWORD_HASH_WORKERS,
+    max_pending=PASSWORD_HASH_MAX_PENDING,
+    use_processes=PASSWORD_HASH_EXECUTOR == "process"
+)